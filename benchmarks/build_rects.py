@@ -0,0 +1,138 @@
+"""
+Benchmark for pytmx.util_pygame.merge_rects, the greedy rect merger used by
+build_rects and simplify.
+
+Run from the repository root:
+
+    python benchmarks/build_rects.py
+
+Synthetic collision layers are made of random solid blocks (walls, houses)
+plus scattered single tiles (rocks, bushes).  The old recursive simplify is
+included for comparison, but only on small layers: it is quadratic and hits
+the recursion limit long before 256x256.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+from pytmx import util_pygame
+
+SIZES = (32, 64, 128, 256, 512, 1024)
+LEGACY_MAX_SIZE = 64
+TILE_SIZE = 16
+
+
+def synthetic_layer(size, seed=0):
+    """Return a size x size bytearray grid with blocks and scattered tiles"""
+    rng = random.Random(seed)
+    grid = bytearray(size * size)
+    for _ in range(size * size // 64):
+        w, h = rng.randint(1, 8), rng.randint(1, 8)
+        x, y = rng.randrange(size - w), rng.randrange(size - h)
+        for row in range(y, y + h):
+            grid[row * size + x : row * size + x + w] = b"\x01" * w
+    for _ in range(size * size // 16):
+        grid[rng.randrange(size * size)] = 1
+    return grid
+
+
+def legacy_simplify(all_points, tilewidth, tileheight):
+    """simplify as it was before merge_rects, for comparison"""
+
+    def pick_rect(points, rects):
+        ox, oy = sorted([(sum(p), p) for p in points])[0][1]
+        x = ox
+        y = oy
+        ex = None
+
+        while 1:
+            x += 1
+            if not (x, y) in points:
+                if ex is None:
+                    ex = x - 1
+
+                if (ox, y + 1) in points:
+                    if x == ex + 1:
+                        y += 1
+                        x = ox
+
+                    else:
+                        y -= 1
+                        break
+                else:
+                    if x <= ex:
+                        y -= 1
+                    break
+
+        c_rect = pygame.Rect(
+            ox * tilewidth,
+            oy * tileheight,
+            (ex - ox + 1) * tilewidth,
+            (y - oy + 1) * tileheight,
+        )
+
+        rects.append(c_rect)
+
+        rect = pygame.Rect(ox, oy, ex - ox + 1, y - oy + 1)
+        kill = [p for p in points if rect.collidepoint(p)]
+        [points.remove(i) for i in kill]
+
+        if points:
+            pick_rect(points, rects)
+
+    rect_list = []
+    while all_points:
+        pick_rect(all_points, rect_list)
+
+    return rect_list
+
+
+def covered(rects, size):
+    """Return the grid the rects cover, failing on any overlap"""
+    grid = bytearray(size * size)
+    for rect in rects:
+        for y in range(rect.top // TILE_SIZE, rect.bottom // TILE_SIZE):
+            for x in range(rect.left // TILE_SIZE, rect.right // TILE_SIZE):
+                assert not grid[y * size + x], "rects overlap"
+                grid[y * size + x] = 1
+    return grid
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    sys.setrecursionlimit(100_000)
+    print(f"{'size':>10} {'tiles':>8} {'rects':>7} {'ms':>9} {'ns/cell':>8}  legacy")
+    for size in SIZES:
+        grid = synthetic_layer(size)
+        rects, duration = timed(
+            util_pygame.merge_rects, grid, size, TILE_SIZE, TILE_SIZE
+        )
+        assert covered(rects, size) == grid, "rects do not match the layer"
+
+        legacy = ""
+        if size <= LEGACY_MAX_SIZE:
+            points = [(i % size, i // size) for i, cell in enumerate(grid) if cell]
+            legacy_rects, legacy_duration = timed(
+                legacy_simplify, points, TILE_SIZE, TILE_SIZE
+            )
+            legacy = f"{len(legacy_rects)} rects, {legacy_duration * 1000:.1f} ms"
+
+        print(
+            f"{size:>4}x{size:<5} {sum(grid):>8} {len(rects):>7} "
+            f"{duration * 1000:>9.2f} {duration * 1e9 / size ** 2:>8.1f}  {legacy}"
+        )
+
+
+if __name__ == "__main__":
+    main()
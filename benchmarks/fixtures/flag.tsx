@@ -0,0 +1,15 @@
+<?xml version="1.0" encoding="UTF-8"?>
+<tileset version="1.10" tiledversion="1.10.2" name="flag" tilewidth="16" tileheight="16" tilecount="4" columns="4" objectalignment="topleft">
+ <image source="../../src/assets/tiled/tilesets/flag.png" width="64" height="16"/>
+ <tile id="0">
+  <properties>
+   <property name="solid" type="bool" value="false"/>
+  </properties>
+  <animation>
+   <frame tileid="0" duration="150"/>
+   <frame tileid="1" duration="150"/>
+   <frame tileid="2" duration="150"/>
+   <frame tileid="3" duration="150"/>
+  </animation>
+ </tile>
+</tileset>
@@ -0,0 +1,358 @@
+"""
+Benchmark for loading maps from .tmx (xml) against .tmj (tiled json).
+
+Run from the repository root:
+
+    python benchmarks/map_formats.py
+
+First the maps in benchmarks/fixtures, which are kept as both .tmx and
+.tmj in the exact form Tiled 1.10 saves them, are checked to load to the same TiledMap from either file.
+Their .tmx files are also run through this script's converter, which must
+give the same TiledMap as Tiled's own json.
+
+Then every map under assets/tiled/maps is converted to .tmj, along with the
+tilesets it uses (to .tsj), in a temporary directory.  Both versions are
+then checked to load to the same TiledMap, and timed.  Tile images are
+not loaded, so only parsing is measured.  Parsed tilesets are cached
+between maps by pytmx, so the cache is cleared before every load.
+"""
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytmx
+
+TILED_DIRECTORY = os.path.join(
+    os.path.dirname(__file__), "..", "src", "assets", "tiled"
+)
+MAP_DIRECTORY = os.path.join(TILED_DIRECTORY, "maps")
+FIXTURE_DIRECTORY = os.path.join(os.path.dirname(__file__), "fixtures")
+RUNS = 5
+
+LAYER_TYPES = {
+    "layer": "tilelayer",
+    "objectgroup": "objectgroup",
+    "imagelayer": "imagelayer",
+    "group": "group",
+}
+BOOL_KEYS = {"visible", "infinite", "locked"}
+
+
+def json_value(key, text):
+    """Return an attribute string as tiled would write it to json"""
+    if key in BOOL_KEYS:
+        return text not in ("0", "false")
+    for cast in (int, float):
+        try:
+            value = cast(text)
+        except ValueError:
+            continue
+        if str(value) == text:
+            return value
+    return text
+
+
+def convert_attributes(node, skip=()):
+    return {k: json_value(k, v) for k, v in node.items() if k not in skip}
+
+
+def convert_properties(node):
+    properties = []
+    for prop in node.findall("properties/property"):
+        prop_type = prop.get("type", "string")
+        value = prop.get("value", prop.text)
+        if prop_type == "class":
+            value = {i["name"]: i["value"] for i in convert_properties(prop)}
+        elif prop_type == "bool":
+            value = value == "true"
+        elif prop_type in ("int", "object"):
+            value = int(value)
+        elif prop_type == "float":
+            value = float(value)
+        converted = {"name": prop.get("name"), "type": prop_type, "value": value}
+        if prop.get("propertytype"):
+            converted["propertytype"] = prop.get("propertytype")
+        properties.append(converted)
+    return properties
+
+
+def convert_image(node, data, relocate):
+    image = node.find("image")
+    if image is None:
+        return
+    data["image"] = relocate(image.get("source"))
+    if image.get("width"):
+        data["imagewidth"] = int(image.get("width"))
+        data["imageheight"] = int(image.get("height"))
+    if image.get("trans"):
+        data["transparentcolor"] = "#" + image.get("trans")
+
+
+def convert_data(data_node, node=None):
+    """Return the encoding of a <data> node, and the gids in it (or in one
+    of its chunks) as tiled writes them to json"""
+    node = data_node if node is None else node
+    data = {}
+    encoding = data_node.get("encoding")
+    if encoding == "base64":
+        data["encoding"] = encoding
+        if data_node.get("compression"):
+            data["compression"] = data_node.get("compression")
+        text = node.text.strip()
+        base64.b64decode(text)
+        return data, text
+    return data, [int(i) for i in node.text.split(",")]
+
+
+def convert_object(node):
+    data = convert_attributes(node)
+    properties = convert_properties(node)
+    if properties:
+        data["properties"] = properties
+    for shape in ("polygon", "polyline"):
+        shape_node = node.find(shape)
+        if shape_node is not None:
+            data[shape] = [
+                dict(zip("xy", map(float, point.split(","))))
+                for point in shape_node.get("points").split()
+            ]
+    for shape in ("ellipse", "point"):
+        if node.find(shape) is not None:
+            data[shape] = True
+    return data
+
+
+def convert_layer(node, relocate):
+    data = convert_attributes(node)
+    data["type"] = LAYER_TYPES[node.tag]
+    properties = convert_properties(node)
+    if properties:
+        data["properties"] = properties
+    if node.tag == "layer":
+        data_node = node.find("data")
+        chunks = data_node.findall("chunk")
+        if chunks:
+            data["chunks"] = []
+            for chunk in chunks:
+                chunk_data = convert_attributes(chunk)
+                encoding, chunk_data["data"] = convert_data(data_node, chunk)
+                data.update(encoding)
+                data["chunks"].append(chunk_data)
+        else:
+            encoding, data["data"] = convert_data(data_node)
+            data.update(encoding)
+    elif node.tag == "objectgroup":
+        data["objects"] = [convert_object(i) for i in node.findall("object")]
+    elif node.tag == "imagelayer":
+        convert_image(node, data, relocate)
+    elif node.tag == "group":
+        data["layers"] = [
+            convert_layer(i, relocate) for i in node if i.tag in LAYER_TYPES
+        ]
+    return data
+
+
+def convert_tileset(node, relocate):
+    data = convert_attributes(node)
+    if "source" in data:
+        data["source"] = os.path.splitext(data["source"])[0] + ".tsj"
+        return data
+    data["type"] = "tileset"
+    properties = convert_properties(node)
+    if properties:
+        data["properties"] = properties
+    offset = node.find("tileoffset")
+    if offset is not None:
+        data["tileoffset"] = convert_attributes(offset)
+    convert_image(node, data, relocate)
+    tiles = []
+    for tile_node in node.findall("tile"):
+        tile = convert_attributes(tile_node)
+        properties = convert_properties(tile_node)
+        if properties:
+            tile["properties"] = properties
+        convert_image(tile_node, tile, relocate)
+        objectgroup = tile_node.find("objectgroup")
+        if objectgroup is not None:
+            tile["objectgroup"] = convert_layer(objectgroup, relocate)
+        animation = tile_node.find("animation")
+        if animation is not None:
+            tile["animation"] = [convert_attributes(i) for i in animation]
+        tiles.append(tile)
+    if tiles:
+        data["tiles"] = tiles
+    return data
+
+
+def convert_map(node, relocate):
+    data = convert_attributes(node)
+    data["type"] = "map"
+    properties = convert_properties(node)
+    if properties:
+        data["properties"] = properties
+    data["tilesets"] = [convert_tileset(i, relocate) for i in node.findall("tileset")]
+    data["layers"] = [convert_layer(i, relocate) for i in node if i.tag in LAYER_TYPES]
+    return data
+
+
+def write_json(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+
+def convert(tmx_path, root, base=TILED_DIRECTORY):
+    """Write a .tmj copy of a map, and .tsj copies of its tilesets, under root
+
+    The copy is placed where the map is relative to base.
+    """
+
+    def relocator(source_directory, destination_directory):
+        def relocate(path):
+            path = os.path.join(source_directory, path)
+            return os.path.relpath(path, destination_directory)
+
+        return relocate
+
+    tmx_directory = os.path.dirname(tmx_path)
+    tmj_path = os.path.join(
+        root,
+        os.path.relpath(os.path.splitext(tmx_path)[0] + ".tmj", base),
+    )
+    tmj_directory = os.path.dirname(tmj_path)
+    node = ElementTree.parse(tmx_path).getroot()
+    write_json(convert_map(node, relocator(tmx_directory, tmj_directory)), tmj_path)
+
+    for tileset in node.findall("tileset"):
+        source = tileset.get("source")
+        if source is None:
+            continue
+        tsx_path = os.path.normpath(os.path.join(tmx_directory, source))
+        tsj_path = os.path.normpath(
+            os.path.join(tmj_directory, os.path.splitext(source)[0] + ".tsj")
+        )
+        if os.path.exists(tsj_path):
+            continue
+        relocate = relocator(os.path.dirname(tsx_path), os.path.dirname(tsj_path))
+        tsx_node = ElementTree.parse(tsx_path).getroot()
+        write_json(convert_tileset(tsx_node, relocate), tsj_path)
+    return tmj_path
+
+
+def describe(tiled_map):
+    """Return everything a game would read from a map, for comparing"""
+
+    directory = os.path.dirname(tiled_map.filename)
+
+    def resolve(values):
+        # image paths differ between the copies, but must find the same file
+        for key in ("source", "path"):
+            if values.get(key):
+                values[key] = os.path.realpath(os.path.join(directory, values[key]))
+        return values
+
+    def element(obj):
+        return resolve(
+            {
+                key: value
+                for key, value in vars(obj).items()
+                if key not in ("parent", "custom_types", "filename", "images")
+                and not isinstance(value, (pytmx.TiledElement, list, dict, memoryview))
+            }
+        )
+
+    layers = []
+    for layer in tiled_map.layers:
+        description = [type(layer).__name__, element(layer), layer.properties]
+        if isinstance(layer, pytmx.TiledTileLayer):
+            description.append(list(layer.iter_data()))
+        if isinstance(layer, pytmx.TiledObjectGroup):
+            description.append(
+                [(element(i), i.properties, getattr(i, "points", None)) for i in layer]
+            )
+        layers.append(description)
+    tile_properties = {
+        gid: resolve({k: v for k, v in props.items() if k != "colliders"})
+        for gid, props in tiled_map.tile_properties.items()
+    }
+    return (
+        element(tiled_map),
+        tiled_map.properties,
+        layers,
+        [element(i) for i in tiled_map.tilesets],
+        tile_properties,
+        dict(tiled_map.gidmap),
+    )
+
+
+def check_fixtures():
+    """Check the json loader and the converter against tiled's own json"""
+    with tempfile.TemporaryDirectory() as root:
+        for name in sorted(os.listdir(FIXTURE_DIRECTORY)):
+            if not name.endswith(".tmx"):
+                continue
+            tmx_path = os.path.join(FIXTURE_DIRECTORY, name)
+            tmj_path = os.path.splitext(tmx_path)[0] + ".tmj"
+            expected = describe(pytmx.TiledMap(tmx_path))
+            if describe(pytmx.TiledMap(tmj_path)) != expected:
+                raise AssertionError(f"{name} does not load the same from json")
+            converted = convert(tmx_path, root, FIXTURE_DIRECTORY)
+            if describe(pytmx.TiledMap(converted)) != expected:
+                raise AssertionError(f"{name} is not converted to json like tiled")
+
+
+def measure(path):
+    """Return median load time and peak traced memory for a map"""
+    times = []
+    for _ in range(RUNS):
+        pytmx.pytmx.tileset_registry.clear()
+        start = time.perf_counter()
+        pytmx.TiledMap(path)
+        times.append(time.perf_counter() - start)
+
+    pytmx.pytmx.tileset_registry.clear()
+    tracemalloc.start()
+    pytmx.TiledMap(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak
+
+
+def main():
+    check_fixtures()
+    print(f"{'map':<16}{'tmx ms':>10}{'tmj ms':>10}{'tmx KiB':>10}{'tmj KiB':>10}")
+    totals = [0, 0, 0, 0]
+    with tempfile.TemporaryDirectory() as root:
+        for name in sorted(os.listdir(MAP_DIRECTORY)):
+            if not name.endswith(".tmx"):
+                continue
+            tmx_path = os.path.join(MAP_DIRECTORY, name)
+            tmj_path = convert(tmx_path, root)
+            tmx = pytmx.TiledMap(tmx_path)
+            tmj = pytmx.TiledMap(tmj_path)
+            if describe(tmx) != describe(tmj):
+                raise AssertionError(f"{name} does not load the same from json")
+
+            tmx_time, tmx_peak = measure(tmx_path)
+            tmj_time, tmj_peak = measure(tmj_path)
+            results = (
+                tmx_time * 1000,
+                tmj_time * 1000,
+                tmx_peak / 1024,
+                tmj_peak / 1024,
+            )
+            totals = [a + b for a, b in zip(totals, results)]
+            print(f"{name[:-4]:<16}" + "".join(f"{i:>10.1f}" for i in results))
+    print(f"{'total':<16}" + "".join(f"{i:>10.1f}" for i in totals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark for physics_batch.PhysicsBatch, against every mobile object doing
+its own physics.
+
+Run from the repository root (needs numpy and the bush submodule):
+
+    python benchmarks/slime_physics.py
+
+Slimes are spawned all over a map, and its main group is updated for a
+while with each slime doing its own physics, then again on a fresh copy of
+the map with its physics batched.  The random seed is the same for both.
+Batched slimes see their new velocity a frame later, so they don't walk
+exactly the same way, but just as much.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+os.chdir(SRC)  # assets are found from src, as when running the game
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import custom_mapper
+import globals
+import physics_batch
+from game_objects import arg
+from game_objects.enemies import slime
+from main import Game
+
+MAP = "test_map.tmx"
+COUNTS = (10, 50, 200, 800)
+FRAMES = 300
+DT = 1 / 30
+
+
+def run(count, batched):
+    """Return the time spent updating the map, and how many slimes were moving"""
+    random.seed(count)
+    registry = custom_mapper.MapLoader().preload(MAP).registry
+    group = registry.get_group("main")
+    group.physics_batch = physics_batch.PhysicsBatch(registry) if batched else None
+    width, height = group.map_size
+    slimes = [
+        slime.Slime(
+            arg.GameObjectArgs(
+                pos=pygame.Vector2(
+                    random.uniform(16, width - 16), random.uniform(16, height - 16)
+                ),
+                registry=registry,
+            )
+        )
+        for _ in range(count)
+    ]
+    moving = 0
+    duration = 0
+    for _ in range(FRAMES):
+        start = time.perf_counter()
+        group.update(DT)
+        duration += time.perf_counter() - start
+        moving += sum(bool(sprite.velocity) for sprite in slimes)
+    return duration, moving / FRAMES
+
+
+def main():
+    if physics_batch.numpy is None:
+        print("numpy is not installed, so physics can't be batched")
+        return
+    game = Game()
+    globals.engine = game
+    asyncio.run(game.setup())
+    print(f"{'slimes':>7} {'per object':>11} {'batched':>9} {'speedup':>8}  moving")
+    for count in COUNTS:
+        duration, moving = run(count, False)
+        batched_duration, batched_moving = run(count, True)
+        print(
+            f"{count:>7} {duration * 1000 / FRAMES:>8.3f} ms "
+            f"{batched_duration * 1000 / FRAMES:>6.3f} ms "
+            f"{duration / batched_duration:>8.2f}  {moving:.0f} / {batched_moving:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,276 @@
+import logging
+import os
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+
 import pygame
 
 import environment
 import globals
+import physics_batch
 import pytmx
-from bush import asset_handler, entity, physics
+import render_group
+from bush import asset_handler, entity, physics, util
 from bush.mapping import group, mapping
 from game_objects import arg, dungeon, npc, overworld, teleport
 from game_objects.enemies import slime
+from pytmx import compiled, util_pygame
+
+# tile layers are baked into sprites of (at most) this many pixels square
+CHUNK_SIZE = 256
+# how far past the camera chunks of infinite maps are loaded, in pixels
+CHUNK_MARGIN = 64
+# how far past the loading area chunks are kept before being unloaded, in pixels
+CHUNK_EVICT_MARGIN = 128
+# how much memory loaded maps may be kept around in, in bytes (estimated)
+REGISTRY_CACHE_BUDGET = 32 * 1024 * 1024
+# estimated memory of a sprite besides its image and mask, in bytes
+SPRITE_OVERHEAD = 512
+
+logger = logging.getLogger(__name__)
+
+# tile passed to handle_tile.  pos is the topleft of its cell in the map,
+# layer is the index of its tile layer
+MapTile = namedtuple("MapTile", ["pos", "image", "properties", "layer", "gid"])
+# everything about a tile that only depends on its gid.  mask is None
+# unless the tile has terrain or collision
+TileInfo = namedtuple(
+    "TileInfo", ["image", "properties", "mask", "groups", "terrain", "y_sorted"]
+)
+# a map after loading.  player_pos is where the player starts by default
+LoadedMap = namedtuple("LoadedMap", ["registry", "properties", "player_pos"])
+
+
+class ChunkStreamer(entity.Entity):
+    """Loads chunks of infinite map layers around the camera as it moves.
+
+    The chunks of every layer at a spot are loaded together.  Each one is
+    baked to one sprite (tiles with properties still go through the map
+    loader's tile handler), and the terrain and static collision of the
+    spot are built for just that chunk.  Chunks that get far enough out of
+    view are dropped again along with their terrain and collision, so load
+    time and memory depend on the view size, not the map size.
+    """
+
+    def __init__(self, loader, tmx_map, registry, origin):
+        self.main_group = registry.get_group("main")
+        super().__init__(
+            (0, 0),
+            pygame.Surface((0, 0)),
+            [self.main_group],
+            topleft=True,
+            no_debug=True,
+        )
+        self.loader = loader
+        self.tmx_map = tmx_map
+        self.tile_size = (tmx_map.tilewidth, tmx_map.tileheight)
+        self.origin = origin  # tile at the topleft of the map
+        self.layers = [
+            (i, tmx_map.layers[i])
+            for i in tmx_map.visible_tile_layers
+            if tmx_map.layers[i].chunks
+        ]
+        self.chunk_size = self.layers[0][1].chunk_size
+        self.collision_group = registry.get_group("collision")
+        self.terrain = registry.terrain_grid
+        # tile images bigger than a cell reach up and right of it
+        self.overhang = (
+            max(tileset.tilewidth for tileset in tmx_map.tilesets) - tmx_map.tilewidth,
+            max(tileset.tileheight for tileset in tmx_map.tilesets)
+            - tmx_map.tileheight,
+        )
+        self.loaded = {}  # (chunk x, chunk y) in tiles: (rect, sprites)
+        # loader state of this map, which may not be the current one later
+        self.loader_state = loader.get_state()
+
+    def load_chunk(self, x, y):
+        """Load the chunks of every layer at (x, y), in tiles"""
+        tile_width, tile_height = self.tile_size
+        chunk_width, chunk_height = self.chunk_size
+        left, top = x - self.origin[0], y - self.origin[1]
+        rect = pygame.Rect(
+            left * tile_width,
+            top * tile_height,
+            chunk_width * tile_width,
+            chunk_height * tile_height,
+        )
+        chunks = [
+            (layer_index, layer.chunks[x, y])
+            for layer_index, layer in self.layers
+            if (x, y) in layer.chunks
+        ]
+        extra_width, extra_height = self.overhang
+        previous_state = self.loader.get_state()
+        self.loader.set_state(self.loader_state)
+        self.loader.static_collider = None
+        self.loader.collider_area = pygame.Rect(
+            rect.left,
+            rect.top - extra_height,
+            rect.width + extra_width,
+            rect.height + extra_height,
+        )
+        try:
+            sprites = []
+            for layer_index, chunk in chunks:
+                sprites.extend(
+                    self.loader.bake_tiles(
+                        self.tmx_map, layer_index, chunk.data, left, top
+                    )
+                )
+            if self.loader.static_collider is not None:
+                sprites.append(self.loader.static_collider)
+            grid, masks = self.loader.build_terrain(
+                self.tmx_map,
+                [(chunk.gids, chunk.width, 0, 0) for _, chunk in chunks],
+                set().union(*(chunk.gids for _, chunk in chunks)) - {0},
+                self.chunk_size,
+            )
+        finally:
+            self.loader.set_state(previous_state)
+        if masks:
+            self.terrain.add(rect.topleft, grid, masks)
+        return rect, sprites
+
+    def unload_chunk(self, key):
+        rect, sprites = self.loaded.pop(key)
+        for sprite in sprites:
+            sprite.kill()
+        self.terrain.remove(rect.topleft)
+
+    def update(self, dt):
+        super().update(dt)
+        view = self.main_group.cam_rect.inflate(CHUNK_MARGIN * 2, CHUNK_MARGIN * 2)
+        keep = view.inflate(CHUNK_EVICT_MARGIN * 2, CHUNK_EVICT_MARGIN * 2)
+        evicted = [
+            key for key, (rect, _) in self.loaded.items() if not keep.colliderect(rect)
+        ]
+        for key in evicted:
+            self.unload_chunk(key)
+
+        tile_width, tile_height = self.tile_size
+        left, top = view.left // tile_width, view.top // tile_height
+        width = view.right // tile_width - left + 1
+        height = view.bottom // tile_height - top + 1
+        left, top = left + self.origin[0], top + self.origin[1]
+        added = False
+        for _, layer in self.layers:
+            for chunk in layer.iter_chunks(left, top, width, height):
+                key = (chunk.x, chunk.y)
+                if key not in self.loaded:
+                    self.loaded[key] = self.load_chunk(*key)
+                    added = True
+        if evicted or added:
+            physics.optimize_for_physics(self.collision_group)
+
+    def kill(self):
+        for key in list(self.loaded):
+            self.unload_chunk(key)
+        super().kill()
+
+
+class StaticCollider(entity.Entity):
+    """The static collision of an area of a map, fused into one sprite.
+
+    Wall tiles and anonymous collision objects are drawn into one mask
+    covering the area (the whole map, or a chunk of an infinite one), so
+    dynamic bodies test it with a single overlap instead of going through a
+    sprite for each of them.
+    """
+
+    def __init__(self, area, registry):
+        collision_group = registry.get_group("collision")
+        super().__init__(
+            (0, 0),
+            pygame.Surface((0, 0)),
+            [collision_group],
+            topleft=True,
+            no_debug=True,
+        )
+        self.rect = pygame.Rect(area)
+        self.mask = pygame.Mask(self.rect.size)
+        self.physics_data = physics.PhysicsData(physics.TYPE_STATIC, collision_group)
+        self.merged = 0  # number of sprites this stands in for
+        self._rects = None
+
+    def merge(self, mask, pos):
+        self.mask.draw(mask, (pos[0] - self.rect.x, pos[1] - self.rect.y))
+        self.merged += 1
+        self._rects = None
+
+    @property
+    def rects(self):
+        """Bounding rects of each connected piece of collision"""
+        if self._rects is None:
+            self._rects = [
+                rect.move(self.rect.topleft) for rect in self.mask.get_bounding_rects()
+            ]
+        return self._rects
+
+
+class RegistryCache:
+    """Keeps loaded maps around, so that going back to them is instant.
+
+    Maps are dropped least recently visited first once their estimated
+    size goes over the byte budget.  Sizes count the pixels of every sprite
+    image and mask in the registry (shared ones once), the terrain masks,
+    and SPRITE_OVERHEAD for each sprite.
+    """
+
+    def __init__(self, group_names, budget=REGISTRY_CACHE_BUDGET):
+        self.group_names = group_names
+        self.budget = budget
+        self.maps = OrderedDict()  # path: (LoadedMap, size)
+        self.size = 0
+
+    def __contains__(self, path):
+        return path in self.maps
+
+    def get(self, path):
+        """Return the loaded map at path, or None if it is not cached"""
+        if path not in self.maps:
+            return None
+        self.maps.move_to_end(path)
+        return self.maps[path][0]
+
+    def add(self, path, loaded):
+        self.discard(path)
+        size = self.estimate_size(loaded.registry)
+        self.maps[path] = (loaded, size)
+        self.size += size
+        # the newest map stays, even if it is over budget on its own
+        while self.size > self.budget and len(self.maps) > 1:
+            old_path, (_, old_size) = self.maps.popitem(last=False)
+            self.size -= old_size
+            logger.debug(f"dropped cached map {old_path} ({old_size} bytes)")
+
+    def discard(self, path):
+        if path in self.maps:
+            self.size -= self.maps.pop(path)[1]
+
+    def clear(self):
+        self.maps.clear()
+        self.size = 0
+
+    def estimate_size(self, registry):
+        sprites = set()
+        for name in self.group_names:
+            sprites.update(registry.get_group(name).sprites())
+        buffers = {}  # id: bytes, so that shared images count once
+        for sprite in sprites:
+            image = getattr(sprite, "image", None)
+            if image is not None:
+                buffers[id(image)] = (
+                    image.get_width() * image.get_height() * image.get_bytesize()
+                )
+            mask = getattr(sprite, "mask", None)
+            if mask is not None:
+                width, height = mask.get_size()
+                buffers[id(mask)] = width * height // 8
+        for name in registry.list_masks():
+            width, height = registry.get_mask(name).get_size()
+            buffers[id(registry.get_mask(name))] = width * height // 8
+        return sum(buffers.values()) + len(sprites) * SPRITE_OVERHEAD
 
 
 class MapLoader(mapping.MapLoader):
@@ -26,61 +290,322 @@ class MapLoader(mapping.MapLoader):
         self.default_player_layer = 4  # second layer (default sub)
         self.mask_loader = asset_handler.AssetHandler("masks")
         self.map_size = None
+        self.static_collider = None
+        self.collider_area = None  # area static collision is merged in, if any
+        self.tile_info = {}  # gid: TileInfo, for the map being loaded
+        self.current_map = None  # LoadedMap the player is in
+        self.current_registry = None
+        # maps are parsed ahead of time on a thread, except on the web
+        # where there are no threads
+        self.prefetch_executor = None
+        if not util.is_pygbag():
+            self.prefetch_executor = ThreadPoolExecutor(
+                1, thread_name_prefix="map-prefetch"
+            )
+        self.prefetched = {}  # path: future of (TiledMap, atlas)
+        self.tmx_cache = {}  # path: TiledMap, kept if cache_files is set
+        # image of tile sprites that are baked into their layer
+        self.blank_tile = pygame.Surface((16, 16), pygame.SRCALPHA)
+        registry_creators = {
+            "main": lambda map_size: render_group.CulledGroup(
+                globals.engine.screen_size,
+                map_size,
+                (0, 0),
+                globals.player,
+                False,
+                debug_physics=False,
+            ),
+            "player": lambda x: pygame.sprite.GroupSingle(),
+            "collision": lambda x: pygame.sprite.Group(),
+            "scriptable": lambda x: group.EntityGroup(),
+            "interactable": lambda x: pygame.sprite.Group(),
+            "attackable": lambda x: pygame.sprite.Group(),
+            "teleports": lambda x: group.EntityGroup(),
+        }
+        self.registry_cache = RegistryCache(tuple(registry_creators))
         super().__init__(
             "tiled/maps",
             sprite_creator=self.create_sprite,
             tile_handler=self.handle_tile,
-            registry_creators={
-                "main": lambda map_size: group.TopDownGroup(
-                    globals.engine.screen_size,
-                    map_size,
-                    (0, 0),
-                    globals.player,
-                    False,
-                    debug_physics=False,
-                ),
-                "player": lambda x: pygame.sprite.GroupSingle(),
-                "collision": lambda x: pygame.sprite.Group(),
-                "scriptable": lambda x: group.EntityGroup(),
-                "interactable": lambda x: pygame.sprite.Group(),
-                "attackable": lambda x: pygame.sprite.Group(),
-                "teleports": lambda x: group.EntityGroup(),
-            },
+            registry_creators=registry_creators,
         )
 
     def handle_tile(self, tile, sprite_group):
-        terrain = tile.properties.get("terrain", None)
+        info = self.tile_info.get(tile.gid)
+        if info is None:
+            info = self.get_tile_info(tile.gid, tile.image, tile.properties)
+        # tiled draws tiles from the bottom left of their cell
+        anchored = pygame.Vector2(tile.pos)
         if tile.image is not None:
-            mask = tile.properties.get("mask", None) or pygame.mask.from_surface(
-                tile.image
-            )
+            anchored.y += 16 - tile.image.get_height()
+        if info.y_sorted:
+            # drawn on its own, so that it can go in front of or behind actors
+            groups = list(info.groups)
+            image = tile.image
+            pos = anchored
+            layer = tile.layer * 3 + 1
         else:
-            mask = pygame.Mask((16, 16))
-        if terrain:
-            if terrain not in self.current_registry.list_masks():
-                self.current_registry.add_mask(terrain, pygame.Mask(self.map_size))
-            self.current_registry.get_mask(terrain).draw(mask, tile.pos)
-        groups = tile.properties.get("groups", "main").split(", ")
+            # already drawn by the baked tile layer
+            groups = [key for key in info.groups if key != "main"]
+            image = self.blank_tile
+            pos = tile.pos
+            layer = tile.layer * 3
+        if "collision" in groups:
+            groups.remove("collision")
+            self.get_static_collider().merge(info.mask, anchored)
         if groups:
-            sprite_groups = [
-                self.current_registry.get_group(group_key) for group_key in groups
-            ]
-            sprite = entity.Entity(
-                tile.pos,
-                pygame.Surface((16, 16), pygame.SRCALPHA),
+            return entity.Entity(
+                pos,
+                image,
                 [self.current_registry.get_group(group_key) for group_key in groups],
+                layer=layer,
                 topleft=True,
                 no_debug=True,
             )
-            if "collision" in groups:
-                sprite.physics_data = physics.PhysicsData(
-                    physics.TYPE_STATIC, self.current_registry.get_group("collision")
+
+    def get_static_collider(self):
+        """Return the static collider of the map being loaded, making it if needed"""
+        if self.static_collider is None:
+            self.static_collider = StaticCollider(
+                self.collider_area, self.current_registry
+            )
+        return self.static_collider
+
+    def get_tile_info(self, gid, image, properties):
+        """Work out (and cache) what the loader needs to know about a tile gid"""
+        groups = tuple(properties.get("groups", "main").split(", "))
+        terrain = properties.get("terrain", None)
+        mask = None
+        if terrain or "collision" in groups:
+            if image is not None:
+                mask = properties.get("mask", None) or pygame.mask.from_surface(image)
+            else:
+                mask = pygame.Mask((16, 16))
+        info = TileInfo(
+            image,
+            properties,
+            mask,
+            groups,
+            terrain,
+            self.is_y_sorted(image, properties),
+        )
+        self.tile_info[gid] = info
+        return info
+
+    @staticmethod
+    def is_y_sorted(image, properties):
+        """Whether a tile needs its own sprite, sorted with the actors on its layer
+
+        Tiles taller than the map grid stick out of their cell, so they are
+        y-sorted.  Others can opt in with a "ysort" property.
+        """
+        if image is None:
+            return False
+        return properties.get("ysort", False) or image.get_height() > 16
+
+    def bake_tiles(self, tmx_map, layer_index, rows, x, y):
+        """Draw a block of tiles from a tile layer onto one sprite.
+
+        Tiles with properties also go through handle_tile.  rows is indexed
+        [y][x], and (x, y) is the position of its topleft in tiles.  Returns
+        the baked sprite and any sprites handle_tile made.
+        """
+        tile_width, tile_height = tmx_map.tilewidth, tmx_map.tileheight
+        main_group = self.current_registry.get_group("main")
+        surface = pygame.Surface(
+            (len(rows[0]) * tile_width, len(rows) * tile_height), pygame.SRCALPHA
+        )
+        sprites = []
+        tile_info = self.tile_info
+        for row_y, row in enumerate(rows):
+            for row_x, gid in enumerate(row):
+                if not gid:
+                    continue
+                info = tile_info.get(gid)
+                if info is None:
+                    info = self.get_tile_info(
+                        gid,
+                        tmx_map.get_tile_image_by_gid(gid),
+                        tmx_map.tile_properties.get(gid, {}),
+                    )
+                if info.image is not None and not info.y_sorted:
+                    # from the bottom left of the cell, like tiled
+                    surface.blit(
+                        info.image,
+                        (
+                            row_x * tile_width,
+                            (row_y + 1) * tile_height - info.image.get_height(),
+                        ),
+                    )
+                if info.properties or info.y_sorted:
+                    tile = MapTile(
+                        pygame.Vector2(
+                            (x + row_x) * tile_width, (y + row_y) * tile_height
+                        ),
+                        info.image,
+                        info.properties,
+                        layer_index,
+                        gid,
+                    )
+                    sprite = self.handle_tile(tile, main_group)
+                    if sprite is not None:
+                        sprites.append(sprite)
+        sprites.append(
+            entity.Entity(
+                (x * tile_width, y * tile_height),
+                surface,
+                [main_group],
+                layer=layer_index * 3,
+                topleft=True,
+                no_debug=True,
+            )
+        )
+        return sprites
+
+    def build_terrain(self, tmx_map, blocks, used_gids, size):
+        """Build the terrain of an area of the map from tile gids, in bulk.
+
+        blocks are (flat gids, width, x, y) of each grid of gids, with (x, y)
+        their topleft in the area, and size is the size of the area, all in
+        tiles.  Gids are mapped to terrain ids through a lookup table, and
+        the cells of each terrain are merged into rects, which are drawn into
+        the masks (and the area's terrain grid) whole.  Only tiles whose mask
+        does not fill their cell are drawn into the masks one by one.
+
+        Returns the TerrainGrid and the terrain masks (by name) of the area.
+        """
+        tile_width, tile_height = tmx_map.tilewidth, tmx_map.tileheight
+        grid = environment.TerrainGrid(size, (tile_width, tile_height))
+        masks = {}
+
+        # terrain id: (terrain, mask of a partial tile or None for full tiles,
+        # how far down the tile is drawn from the top of its cell)
+        terrains = [None]
+        terrain_ids = {}
+        lookup = {}
+        for gid in used_gids:
+            info = self.tile_info.get(gid)
+            if info is None:
+                info = self.get_tile_info(
+                    gid,
+                    tmx_map.get_tile_image_by_gid(gid),
+                    tmx_map.tile_properties.get(gid, {}),
+                )
+            if not info.terrain:
+                continue
+            mask = info.mask
+            if mask.get_size() == (tile_width, tile_height) and mask.count() == (
+                tile_width * tile_height
+            ):
+                mask = None
+            # tiled draws tiles from the bottom left of their cell
+            offset = 0
+            if info.image is not None:
+                offset = tile_height - info.image.get_height()
+            key = (info.terrain, mask, offset)
+            if key not in terrain_ids:
+                terrain_ids[key] = len(terrains)
+                terrains.append(key)
+            lookup[gid] = terrain_ids[key]
+        if not lookup:
+            return grid, masks
+        if len(terrains) > 256:
+            raise ValueError(f"{tmx_map.filename} has too many kinds of terrain tile")
+
+        rects = defaultdict(list)  # terrain id: rects of its cells, in tiles
+        for gids, width, x, y in blocks:
+            ids = bytearray(map(lookup.get, gids, repeat(0)))
+            for terrain_id in set(ids):
+                if not terrain_id:
+                    continue
+                table = bytes(i == terrain_id for i in range(256))
+                for rect in util_pygame.merge_rects(ids.translate(table), width, 1, 1):
+                    rects[terrain_id].append(rect.move(x, y))
+
+        names = defaultdict(list)  # terrain: rects of its cells, in tiles
+        for terrain_id, terrain_rects in rects.items():
+            terrain, mask, offset = terrains[terrain_id]
+            names[terrain].extend(terrain_rects)
+            if mask is not None:
+                # masks of big tiles reach into the cells above and to the
+                # right, as the tiles are drawn up from the bottom left
+                mask_width = mask.get_size()[0]
+                extra_width = -(-mask_width // tile_width) - 1
+                extra_height = -(offset // tile_height)
+                grid.mark_partial(
+                    pygame.Rect(
+                        rect.x,
+                        rect.y - extra_height,
+                        rect.width + extra_width,
+                        rect.height + extra_height,
+                    )
+                    for rect in terrain_rects
+                )
+            if terrain not in masks:
+                masks[terrain] = pygame.Mask(
+                    (size[0] * tile_width, size[1] * tile_height)
+                )
+            terrain_mask = masks[terrain]
+            for rect in terrain_rects:
+                if mask is None:
+                    terrain_mask.draw(
+                        pygame.Mask(
+                            (rect.width * tile_width, rect.height * tile_height), True
+                        ),
+                        (rect.x * tile_width, rect.y * tile_height),
+                    )
+                    continue
+                for cell_y in range(rect.top, rect.bottom):
+                    for cell_x in range(rect.left, rect.right):
+                        terrain_mask.draw(
+                            mask,
+                            (cell_x * tile_width, cell_y * tile_height + offset),
+                        )
+
+        # lowest priority first, so that higher priorities overwrite it
+        order = environment.TERRAIN_ORDER
+        for terrain in sorted(
+            names,
+            key=lambda name: order.index(name) if name in order else len(order),
+            reverse=True,
+        ):
+            grid.fill(names[terrain], terrain)
+        return grid, masks
+
+    def bake_layer(self, tmx_map, layer_index):
+        """Bake a finite tile layer into sprites of CHUNK_SIZE pixels"""
+        layer = tmx_map.layers[layer_index]
+        chunk_width = CHUNK_SIZE // tmx_map.tilewidth
+        chunk_height = CHUNK_SIZE // tmx_map.tileheight
+        for y in range(0, layer.height, chunk_height):
+            rows = layer.data[y : y + chunk_height]
+            for x in range(0, layer.width, chunk_width):
+                self.bake_tiles(
+                    tmx_map,
+                    layer_index,
+                    [row[x : x + chunk_width] for row in rows],
+                    x,
+                    y,
                 )
-                sprite.mask = mask
 
     def create_sprite(self, obj, sprite_group):
         if obj.type is None:
             groups = obj.properties.get("groups", "main").split(", ")
+            if (
+                "collision" in groups
+                and obj.name is None
+                and self.collider_area is not None
+            ):
+                # nothing can refer to it to move or remove it, so it is static
+                groups.remove("collision")
+                mask = obj.properties.get("mask", None)
+                if mask is None:
+                    mask = pygame.mask.from_surface(obj.image)
+                else:
+                    mask = pygame.mask.from_surface(self.mask_loader.load(mask))
+                self.get_static_collider().merge(mask, obj.pos)
+                if not groups:
+                    return
             sprite = entity.Entity(
                 pos=obj.pos,
                 layer=obj.layer * 3 + 1,
@@ -108,33 +633,256 @@ class MapLoader(mapping.MapLoader):
             arg.from_mapping_object(obj, self.current_registry)
         )
 
+    def prefetch(self, paths):
+        """Start parsing maps in the background, so that loading them is quick.
+
+        Only the parsing happens off of the main thread.  Images are still
+        loaded and sprites made by load.  Earlier prefetches of maps that
+        are not in paths are dropped.
+        """
+        paths = {
+            path
+            for path in paths
+            if not isinstance(path, pytmx.TiledMap)
+            and path not in self.registry_cache
+            and path not in self.tmx_cache
+        }
+        for path in list(self.prefetched):
+            if path not in paths:
+                self.prefetched.pop(path).cancel()
+        if self.prefetch_executor is None:
+            return
+        for path in paths - self.prefetched.keys():
+            self.prefetched[path] = self.prefetch_executor.submit(
+                compiled.read_map,
+                self.get_map_path(path),
+                util_pygame.pygame_image_loader,
+            )
+
+    def get_map_path(self, path):
+        """Return the file path of a map given relative to the maps directory"""
+        return os.path.join(self.loader.base, path)
+
+    def load_tmx(self, path):
+        """Load a tmx map, relative to the maps directory, through its compiled cache"""
+        if path in self.tmx_cache:
+            return self.tmx_cache[path]
+        future = self.prefetched.pop(path, None)
+        if future is None:
+            tmx_map = compiled.load_map(
+                self.get_map_path(path), util_pygame.pygame_image_loader
+            )
+        else:
+            # waits for the parse, if it is still going
+            tmx_map, atlas = future.result()
+            tmx_map.load_images(atlas)
+        if self.cache_files:
+            self.tmx_cache[path] = tmx_map
+        return tmx_map
+
+    def clear_cache(self):
+        super().clear_cache()
+        self.registry_cache.clear()
+        self.tmx_cache.clear()
+
+    def get_state(self):
+        """Return the state used while building a map's sprites"""
+        return (
+            self.current_registry,
+            self.map_size,
+            self.static_collider,
+            self.collider_area,
+            self.tile_info,
+        )
+
+    def set_state(self, state):
+        (
+            self.current_registry,
+            self.map_size,
+            self.static_collider,
+            self.collider_area,
+            self.tile_info,
+        ) = state
+
+    def remove_player(self, registry):
+        """Take the player out of every group of a map it is leaving"""
+        for name in self.registry_cache.group_names:
+            registry.get_group(name).remove(globals.player)
+
+    def enter(self, loaded, player_pos=None):
+        """Make a loaded map the current one, and put the player in it"""
+        if player_pos is None:
+            player_pos = loaded.player_pos
+        else:
+            # given in tiled's coordinates
+            player_pos = pygame.Vector2(player_pos) + loaded.registry.tiled_origin
+        self.set_current(loaded)
+        globals.player.reset(
+            player_pos,
+            loaded.properties.get("player_layer", self.default_player_layer),
+            self.current_registry,
+        )
+        return (self.current_registry, loaded.properties)
+
+    def switch(self, loaded, player_pos):
+        """Make a loaded map the current one, and walk the player into it
+
+        Unlike enter, the position is in the map's own coordinates and the
+        player keeps anything it is carrying.
+        """
+        self.set_current(loaded)
+        globals.player.change_map(
+            player_pos,
+            loaded.properties.get("player_layer", self.default_player_layer),
+            self.current_registry,
+        )
+        return (self.current_registry, loaded.properties)
+
+    def set_current(self, loaded):
+        self.current_registry = loaded.registry
+        self.current_map = loaded
+        globals.engine.sky.set_weather(
+            loaded.properties.get("ambience", globals.engine.sky.WEATHERTYPE_DNCYCLE)
+        )
+
+    def is_ready(self, path):
+        """Whether a map can be loaded without waiting for it to be parsed"""
+        if self.prefetch_executor is None:
+            # nothing is parsed ahead of time on the web
+            return True
+        if path in self.registry_cache or path in self.tmx_cache:
+            return True
+        future = self.prefetched.get(path)
+        return future is not None and future.done()
+
     def load(self, tmx_map, player_pos=None):
+        return self.enter(self.preload(tmx_map), player_pos)
+
+    def preload(self, tmx_map):
+        """Return a loaded map, from the cache if it is there, without entering it"""
+        if not isinstance(tmx_map, pytmx.TiledMap):
+            loaded = self.registry_cache.get(tmx_map)
+            if loaded is not None:
+                logger.debug(f"map {tmx_map} loaded from cache")
+                return loaded
+        current_registry = self.current_registry
+        try:
+            return self.build(tmx_map)
+        finally:
+            self.current_registry = current_registry
+
+    def build(self, tmx_map):
+        """Load a map and make all of its sprites"""
+        path = None
         if not isinstance(tmx_map, pytmx.TiledMap):
-            tmx_map = self.loader.load(tmx_map, self.cache_files)
-        self.map_size = pygame.Vector2(
-            tmx_map.width * tmx_map.tilewidth, tmx_map.height * tmx_map.tileheight
+            path = tmx_map
+            tmx_map = self.load_tmx(path)
+        chunked_layers = [
+            layer
+            for layer in tmx_map.layers
+            if isinstance(layer, pytmx.TiledTileLayer) and layer.chunks
+        ]
+        tile_width, tile_height = tmx_map.tilewidth, tmx_map.tileheight
+        origin = (0, 0)  # tile at the topleft of the map
+        width, height = tmx_map.width, tmx_map.height
+        if chunked_layers:
+            # infinite maps cover their chunks, which can be left or above of
+            # tile (0, 0)
+            bounds = [layer.get_chunk_bounds() for layer in chunked_layers]
+            origin = (min(i[0] for i in bounds), min(i[1] for i in bounds))
+            width = max(i[2] for i in bounds) - origin[0]
+            height = max(i[3] for i in bounds) - origin[1]
+        # so that bush sizes the map groups the same way
+        tmx_map.width, tmx_map.height = width, height
+        self.map_size = pygame.Vector2(width * tile_width, height * tile_height)
+        # where tiled's (0, 0) ends up in the map
+        tiled_origin = pygame.Vector2(-origin[0] * tile_width, -origin[1] * tile_height)
+        self.static_collider = None
+        # infinite maps get a static collider per chunk, so nothing map sized
+        self.collider_area = None
+        if not chunked_layers:
+            self.collider_area = pygame.Rect((0, 0), self.map_size)
+        self.tile_info = {}
+        # tile layers are baked (or streamed in, for chunks) here, so hide
+        # their tiles from bush
+        tile_layers = list(tmx_map.visible_tile_layers)
+        hidden = [
+            (tmx_map.layers[i].data, tmx_map.layers[i].chunks) for i in tile_layers
+        ]
+        for i in tile_layers:
+            tmx_map.layers[i].data, tmx_map.layers[i].chunks = [], {}
+        objects = list(tmx_map.objects) if tiled_origin else []
+        for obj in objects:
+            obj.x += tiled_origin.x
+            obj.y += tiled_origin.y
+        try:
+            self.current_registry, properties = super().load(tmx_map)
+        finally:
+            for i, (data, chunks) in zip(tile_layers, hidden):
+                tmx_map.layers[i].data, tmx_map.layers[i].chunks = data, chunks
+            for obj in objects:
+                obj.x -= tiled_origin.x
+                obj.y -= tiled_origin.y
+        self.current_registry.tiled_origin = tiled_origin
+        if chunked_layers:
+            # filled in by the chunk streamer
+            chunk_width, chunk_height = chunked_layers[0].chunk_size
+            self.current_registry.terrain_grid = environment.ChunkedTerrain(
+                (chunk_width * tile_width, chunk_height * tile_height)
+            )
+        else:
+            for i in tile_layers:
+                self.bake_layer(tmx_map, i)
+            layers = [tmx_map.layers[i] for i in tile_layers]
+            grid, masks = self.build_terrain(
+                tmx_map,
+                [(layer.gids, layer.width, 0, 0) for layer in layers],
+                set().union(*(layer.used_gids for layer in layers)),
+                (width, height),
+            )
+            self.current_registry.terrain_grid = grid
+            for name, mask in masks.items():
+                self.current_registry.add_mask(name, mask)
+        # tile images are loaded lazily, so this shows what the map really used
+        logger.debug(
+            f"map {tmx_map.filename}: {tmx_map.images.materialized} tile images loaded, "
+            f"{tmx_map.images.deferred} never used"
+        )
+        logger.debug(
+            f"tileset image cache hit rate {util_pygame.tileset_cache.hit_rate():.0%}, "
+            f"{util_pygame.tileset_cache.hit_rate(True):.0%} for flipped tiles"
         )
-        self.current_registry, properties = super().load(tmx_map)
         sprite_group = self.current_registry.get_group("main")
-        if player_pos is None:
-            player_pos = pygame.Vector2(
+        sprite_group.physics_batch = physics_batch.make_batch(self.current_registry)
+        loaded = LoadedMap(
+            self.current_registry,
+            properties,
+            pygame.Vector2(
                 [
                     int(i)
                     for i in tmx_map.properties.get("player_pos", "48, 48").split(", ")
                 ]
             )
-        globals.player.reset(
-            player_pos,
-            properties.get("player_layer", self.default_player_layer),
-            self.current_registry,
+            + tiled_origin,
         )
         self.current_registry.get_group("main").add(sprite_group)
+        if chunked_layers:
+            ChunkStreamer(self, tmx_map, self.current_registry, origin).update(0)
 
-        physics.optimize_for_physics(self.current_registry.get_group("collision"))
+        collision_group = self.current_registry.get_group("collision")
+        if self.static_collider is not None:
+            logger.debug(
+                f"map {tmx_map.filename}: {self.static_collider.merged} static "
+                f"colliders merged, so each dynamic body has {len(collision_group)} "
+                f"collision candidates a frame instead of "
+                f"{len(collision_group) - 1 + self.static_collider.merged}"
+            )
+        physics.optimize_for_physics(collision_group)
+        # infinite maps keep their terrain masks per chunk instead
+        mask_size = (0, 0) if chunked_layers else self.map_size
         for key in environment.TERRAIN_ORDER:
             if key not in self.current_registry.list_masks():
-                self.current_registry.add_mask(key, pygame.Mask(self.map_size))
-        globals.engine.sky.set_weather(
-            properties.get("ambience", globals.engine.sky.WEATHERTYPE_DNCYCLE)
-        )
-        return (self.current_registry, properties)
+                self.current_registry.add_mask(key, pygame.Mask(mask_size))
+        if path is not None:
+            self.registry_cache.add(path, loaded)
+        return loaded
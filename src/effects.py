@@ -0,0 +1,137 @@
+"""
+Visual effects for game objects, like blinking when hit.
+
+An effect only ever has a couple of looks (a phase), and the frames it
+makes are kept in a cache keyed by (source frame, effect, phase).  So each
+animation frame is only ever blinked or flickered once, no matter how many
+sprites are using it or for how long.
+"""
+import logging
+import weakref
+
+import pygame
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache:
+    """Holds the frames made by effects, and counts how many get made"""
+
+    def __init__(self):
+        # frames are dropped along with the animation frame they were made from
+        self.frames = weakref.WeakKeyDictionary()
+        self.allocated = 0  # frames made since the last game frame
+        self.peak_allocated = 0
+
+    def get(self, source, key, render):
+        variants = self.frames.setdefault(source, {})
+        if key not in variants:
+            frame = render(source)
+            if frame is source:
+                # keeping the source as its own variant would keep it alive
+                return source
+            variants[key] = frame
+            self.allocated += 1
+        return variants[key]
+
+    def next_frame(self):
+        """Call once a frame to log and reset the allocation counter"""
+        if self.allocated:
+            self.peak_allocated = max(self.peak_allocated, self.allocated)
+            logger.debug(
+                f"effects made {self.allocated} frames "
+                f"(peak {self.peak_allocated} in a frame)"
+            )
+        self.allocated = 0
+
+    def clear(self):
+        self.frames.clear()
+
+
+frame_cache = FrameCache()
+
+
+class Effect:
+    """Base class for visual effects that alternate between looks
+
+    Subclasses give the phase at a time and how to render a phase.  Phase 0
+    is always the untouched frame.  On its own an Effect changes nothing,
+    it just takes up time.
+    """
+
+    def __init__(self, length, interval):
+        self.length = length
+        self.interval = interval
+        self.time = 0
+
+    def reset(self):
+        self.time = 0
+
+    def done(self):
+        return self.time >= self.length
+
+    def update(self, dt):
+        self.time += dt * 1000
+
+    def phase(self):
+        return int(self.time // self.interval) % 2
+
+    def render(self, surface, phase):
+        return surface
+
+    def apply(self, surface):
+        phase = self.phase()
+        if not phase:
+            return surface
+        return frame_cache.get(
+            surface,
+            (type(self), self.cache_key(), phase),
+            lambda source: self.render(source, phase),
+        )
+
+    def cache_key(self):
+        """Settings that change how a phase looks"""
+        return ()
+
+
+class Blink(Effect):
+    """Turns the sprite invisible every other interval"""
+
+    def __init__(self, length, interval=100):
+        super().__init__(length, interval)
+
+    def render(self, surface, phase):
+        return pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+
+
+class Flicker(Effect):
+    """Turns the sprite see-through every other interval"""
+
+    def __init__(self, length, interval=60, alpha=96):
+        super().__init__(length, interval)
+        self.alpha = alpha
+
+    def cache_key(self):
+        return (self.alpha,)
+
+    def render(self, surface, phase):
+        source, surface = surface, pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+        surface.blit(source, (0, 0))
+        surface.fill((255, 255, 255, self.alpha), special_flags=pygame.BLEND_RGBA_MULT)
+        return surface
+
+
+class Tint(Effect):
+    """Tints the sprite a colour every other interval"""
+
+    def __init__(self, length, color, interval=100):
+        super().__init__(length, interval)
+        self.color = pygame.Color(color)
+
+    def cache_key(self):
+        return (tuple(self.color),)
+
+    def render(self, surface, phase):
+        surface = surface.copy()
+        surface.fill(self.color, special_flags=pygame.BLEND_RGB_MULT)
+        return surface
@@ -36,6 +36,140 @@ def init():
     del key, value  # don't want those cluttering up the namespace
 
 
+class TerrainGrid:
+    """The terrain of every tile of a map, as one byte per tile.
+
+    Each byte indexes names, with 0 for tiles that have no terrain.  Where
+    terrains overlap, the tile gets the one that comes first in
+    TERRAIN_ORDER.  Tiles that terrain only covers part of are marked as
+    partial, as the grid can't tell what is where inside of them.
+    """
+
+    def __init__(self, size, tile_size):
+        self.width, self.height = size
+        self.tile_width, self.tile_height = tile_size
+        self.names = ["default"]
+        self.cells = bytearray(self.width * self.height)
+        self.partial = bytearray(self.width * self.height)
+        self.ranks = None  # position in TERRAIN_ORDER of each name
+
+    def get_rows(self, rect):
+        """Yield the (start, end) of each row of cells in rect (given in tiles)"""
+        rect = rect.clip(0, 0, self.width, self.height)
+        for y in range(rect.top, rect.bottom):
+            start = y * self.width + rect.left
+            yield start, start + rect.width
+
+    def fill(self, rects, name):
+        """Set the terrain of every tile in rects (given in tiles)"""
+        if name not in self.names:
+            self.names.append(name)
+            self.ranks = None
+        value = bytes([self.names.index(name)])
+        for rect in rects:
+            for start, end in self.get_rows(rect):
+                self.cells[start:end] = value * (end - start)
+
+    def mark_partial(self, rects):
+        """Mark every tile in rects (given in tiles) as partly covered"""
+        for rect in rects:
+            for start, end in self.get_rows(rect):
+                self.partial[start:end] = b"\x01" * (end - start)
+
+    def get_in_rect(self, rect):
+        """Return the highest priority terrain that a pixel rect touches.
+
+        Returns None if the rect touches a partial tile, in which case the
+        terrain masks have to be checked instead.
+        """
+        if rect.width <= 0 or rect.height <= 0:
+            return "default"
+        left, top = rect.left // self.tile_width, rect.top // self.tile_height
+        footprint = pygame.Rect(
+            left,
+            top,
+            (rect.right - 1) // self.tile_width - left + 1,
+            (rect.bottom - 1) // self.tile_height - top + 1,
+        )
+        found = set()
+        for start, end in self.get_rows(footprint):
+            if self.partial.find(1, start, end) != -1:
+                return None
+            found.update(self.cells[start:end])
+        if self.ranks is None:
+            self.ranks = [
+                TERRAIN_ORDER.index(name)
+                if name in TERRAIN_ORDER
+                else len(TERRAIN_ORDER)
+                for name in self.names
+            ]
+        best = min(found, key=self.ranks.__getitem__, default=0)
+        if self.ranks[best] == len(TERRAIN_ORDER):
+            # not a terrain that is looked for
+            return "default"
+        return self.names[best]
+
+    def get(self, pos):
+        """Return the name of the terrain at a pixel position"""
+        x, y = int(pos[0] // self.tile_width), int(pos[1] // self.tile_height)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.names[self.cells[y * self.width + x]]
+        return "default"
+
+
+class ChunkedTerrain:
+    """The terrain of an infinite map, kept only for the chunks that are loaded.
+
+    Each loaded chunk has its own TerrainGrid and terrain masks, covering
+    just the chunk.  Chunks are aligned to a grid of chunk_size pixels from
+    the map's topleft, and anywhere without a loaded chunk is "default".
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_width, self.chunk_height = chunk_size
+        self.chunks = {}  # (chunk x, chunk y) in chunks: (TerrainGrid, masks)
+
+    def get_key(self, pos):
+        return pos[0] // self.chunk_width, pos[1] // self.chunk_height
+
+    def add(self, pos, grid, masks):
+        """Add the terrain of the chunk with its topleft at pos"""
+        self.chunks[self.get_key(pos)] = (grid, masks)
+
+    def remove(self, pos):
+        self.chunks.pop(self.get_key(pos), None)
+
+    def get_in_rect(self, rect):
+        """Return the highest priority terrain that a pixel rect touches"""
+        found = []
+        left, top = self.get_key(rect.topleft)
+        right, bottom = self.get_key((rect.right - 1, rect.bottom - 1))
+        for key_y in range(top, bottom + 1):
+            for key_x in range(left, right + 1):
+                if (key_x, key_y) not in self.chunks:
+                    continue
+                grid, masks = self.chunks[key_x, key_y]
+                local = rect.move(
+                    -key_x * self.chunk_width, -key_y * self.chunk_height
+                ).clip(0, 0, self.chunk_width, self.chunk_height)
+                terrain = grid.get_in_rect(local)
+                if terrain is None:
+                    terrain = "default"
+                    area = pygame.Mask(local.size, True)
+                    for name in TERRAIN_ORDER:
+                        if name in masks and masks[name].overlap(area, local.topleft):
+                            terrain = name
+                            break
+                found.append(terrain)
+        return min(
+            found,
+            key=lambda name: TERRAIN_ORDER.index(name)
+            if name in TERRAIN_ORDER
+            else len(TERRAIN_ORDER),
+            default="default",
+        )
+
+
 class EnvironmentHandler:
     def __init__(self, env_masks=None):
         self.env_masks = env_masks or {}
@@ -73,6 +73,21 @@ class GameObject(entity.Actor):
     def get_anim_key(self):
         return self.state
 
+    def player_here(self):
+        """Whether the player is in this object's map
+
+        Maps next to the player's can be updated too when a world is
+        streamed, and their positions are not relative to the player's map.
+        """
+        return globals.player.registry is self.registry
+
+    def change_registry(self, registry):
+        """Move into the groups of another map"""
+        self.remove(*self.groups())
+        self.registry = registry
+        self.add(*(registry.get_group(i) for i in self.registry_groups))
+        self.spawn_groups = tuple(self.groups())
+
     def add_visual_effect(self, effect):
         self.visual_effects.append(effect)
 
@@ -133,7 +148,8 @@ class GameObject(entity.Actor):
             self.anim = self.anim_dict[self.get_anim_key()]
         if self.anim:
             self.image = self.anim.image()
-        self.visual_effects = [e for e in self.visual_effects if not e.done()]
+        if any(effect.done() for effect in self.visual_effects):
+            self.visual_effects = [e for e in self.visual_effects if not e.done()]
         for effect in self.visual_effects:
             effect.update(dt)
             self.image = effect.apply(self.image)
@@ -168,6 +184,9 @@ class GameObject(entity.Actor):
 
 
 class MobileGameObject(GameObject):
+    # whether physics may be left to the map's PhysicsBatch, if it has one
+    batch_physics = True
+
     def __init__(
         self,
         data,
@@ -205,14 +224,17 @@ class MobileGameObject(GameObject):
         self.force += (self.pos - from_pos).normalize() * amount * 200
 
     def get_current_environment(self):
-        return environment.TERRAIN_DATA[
-            self.registry.masks.collide_mask(
-                pygame.Mask(self.collision_rect.size, True),
-                self.collision_rect.topleft,
-                *environment.TERRAIN_ORDER,
+        terrain = self.registry.terrain_grid.get_in_rect(self.collision_rect)
+        if terrain is None:
+            terrain = (
+                self.registry.masks.collide_mask(
+                    pygame.Mask(self.collision_rect.size, True),
+                    self.collision_rect.topleft,
+                    *environment.TERRAIN_ORDER,
+                )
+                or "default"
             )
-            or "default"
-        ]
+        return environment.TERRAIN_DATA[terrain]
 
     def mobilize(self):
         self.mobile = True
@@ -238,6 +260,10 @@ class MobileGameObject(GameObject):
     def update_physics(self, dt):
         self.desired_velocity *= self.mobile
         self.update_rects()
+        batch = self.registry.get_group("main").physics_batch
+        if self.batch_physics and batch is not None:
+            batch.queue(self)
+            return
         terrain = self.get_current_environment()
         # slippety-slide!
         if terrain.traction != 1:
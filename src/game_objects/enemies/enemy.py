@@ -1,7 +1,8 @@
 import os
 
+import effects
 import globals
-from bush import effect, physics
+from bush import physics
 from game_objects import base
 
 
@@ -50,7 +51,7 @@ class BaseEnemy(base.MobileGameObject):
             ),
             start_health=start_health,
             max_health=max_health,
-            hit_effect=effect.Blink(500),
+            hit_effect=effects.Blink(500),
         )
         self.speed = speed
         self.touch_damage = touch_damage
@@ -67,7 +68,9 @@ class BaseEnemy(base.MobileGameObject):
 
     def update_state(self, dt):
         super().update_state(dt)
-        if globals.player.collision_rect.colliderect(self.collision_rect):
+        if self.player_here() and globals.player.collision_rect.colliderect(
+            self.collision_rect
+        ):
             globals.player.hurt(self.touch_damage)
 
     def reload(self):
@@ -57,11 +57,12 @@ class DynamicNPC(base.MobileGameObject):
         self.run_script(self.script)
 
     def interact(self):
-        self.facing = util.round_string_direction(
-            util.string_direction(globals.player.pos - self.pos),
-            util.METHOD_COUNTERCLOCKWISE,
-        )
-        self.face(globals.player.pos)
+        if self.player_here():
+            self.facing = util.round_string_direction(
+                util.string_direction(globals.player.pos - self.pos),
+                util.METHOD_COUNTERCLOCKWISE,
+            )
+            self.face(globals.player.pos)
         self.stop()
         self.run_script(self.interaction_script)
 
@@ -6,31 +6,89 @@ from copy import deepcopy
 
 import pygame
 
+import effects
 import globals
 import inators
-from bush import animation, asset_handler, effect, event_binding, physics, util
+from bush import animation, asset_handler, event_binding, physics, util
 from game_objects import arg, base
 
 SPEED_MEANDERING = 32
 SPEED_WALKING = 96
 SPEED_RUNNING = 140
 
+PLAYER_LAYERS = ("feet", "torso", "arms", "head")  # bottom to top
+PLAYER_FRAME_SIZE = (16, 32)
+PLAYER_FRAME_TIME = 70
+# first frame and frame count of each facing in the layer sheets
+PLAYER_FACINGS = {"down": (0, 8), "up": (8, 8), "right": (16, 8)}
+DEFAULT_OUTFIT = {layer: "default" for layer in PLAYER_LAYERS}
+
 loader = asset_handler.AssetHandler("sprites/player")
 logger = logging.getLogger(__name__)
+baked_outfits = {}  # layer sheet names: {facing: frames}
+
+
+def bake_outfit(outfit):
+    """Composite the layer sheets of an outfit into one atlas and return its frames by facing
+
+    Left facing frames are mirrored from the right facing ones into a second
+    row of the atlas.  Baked outfits are kept and shared by every player.
+    """
+    key = tuple(outfit[layer] for layer in PLAYER_LAYERS)
+    if key in baked_outfits:
+        return baked_outfits[key]
+    sheets = [
+        loader.load_spritesheet(f"{layer}-{outfit[layer]}.png", PLAYER_FRAME_SIZE)
+        for layer in PLAYER_LAYERS
+    ]
+    width, height = PLAYER_FRAME_SIZE
+    frame_count = min(len(sheet) for sheet in sheets)
+    mirror_start, mirror_count = PLAYER_FACINGS["right"]
+    atlas = pygame.Surface((width * frame_count, height * 2), pygame.SRCALPHA)
+    for sheet in sheets:
+        for i, frame in enumerate(sheet[:frame_count]):
+            atlas.blit(frame, (i * width, 0))
+    frames = [
+        atlas.subsurface((i * width, 0, width, height)) for i in range(frame_count)
+    ]
+    for i in range(mirror_count):
+        frame = frames[mirror_start + i]
+        atlas.blit(pygame.transform.flip(frame, True, False), (i * width, height))
+    mirrored = [
+        atlas.subsurface((i * width, height, width, height))
+        for i in range(mirror_count)
+    ]
+
+    facings = {
+        facing: frames[start : start + count]
+        for facing, (start, count) in PLAYER_FACINGS.items()
+    }
+    facings["left"] = mirrored
+    baked_outfits[key] = facings
+    return facings
+
+
+def get_outfit_anims(outfit):
+    """Return new walk and idle animations for an outfit, made from its baked frames"""
+    anim_dict = {}
+    for facing, frames in bake_outfit(outfit).items():
+        anim_dict[f"walk {facing}"] = animation.Animation(frames, PLAYER_FRAME_TIME)
+        anim_dict[f"idle {facing}"] = animation.Animation(
+            frames[-1:], PLAYER_FRAME_TIME
+        )
+    return anim_dict
 
 
 class Player(base.MobileGameObject):
     """main player of the game"""
 
     registry_groups = ()  # do NOT add to any groups on setup, registry will be None
+    # the camera follows the player, so it can't wait for the rest of the map
+    batch_physics = False
     true_groups = ("main", "player", "attackable", "scriptable")
 
     def __init__(self):
         tiny_frames = loader.load_spritesheet("tiny.png", (16, 16))
-        foot_frames = loader.load_spritesheet("feet-default.png", (16, 32))
-        torso_frames = loader.load_spritesheet("torso-default.png", (16, 32))
-        arm_frames = loader.load_spritesheet("arms-default.png", (16, 32))
-        head_frames = loader.load_spritesheet("head-default.png", (16, 32))
         anim_dict = {
             "tiny walk down": animation.Animation(tiny_frames[0:16:4], 150),
             "tiny walk up": animation.Animation(tiny_frames[1:17:4], 150),
@@ -40,77 +98,14 @@ class Player(base.MobileGameObject):
             "tiny idle up": animation.Animation(tiny_frames[1:2]),
             "tiny idle left": animation.Animation(tiny_frames[2:3]),
             "tiny idle right": animation.Animation(tiny_frames[3:4]),
-            "walk down": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[0:8], 70),
-                    animation.Animation(torso_frames[0:8], 70),
-                    animation.Animation(arm_frames[0:8], 70),
-                    animation.Animation(head_frames[0:8], 70),
-                )
-            ),
-            "walk up": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[8:16], 70),
-                    animation.Animation(torso_frames[8:16], 70),
-                    animation.Animation(arm_frames[8:16], 70),
-                    animation.Animation(head_frames[8:16], 70),
-                )
-            ),
-            "walk right": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[16:24], 70),
-                    animation.Animation(torso_frames[16:24], 70),
-                    animation.Animation(arm_frames[16:24], 70),
-                    animation.Animation(head_frames[16:24], 70),
-                )
-            ),
-            "walk left": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[16:24], 70, mirror_x=True),
-                    animation.Animation(torso_frames[16:24], 70, mirror_x=True),
-                    animation.Animation(arm_frames[16:24], 70, mirror_x=True),
-                    animation.Animation(head_frames[16:24], 70, mirror_x=True),
-                )
-            ),
-            "idle down": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[7:8], 70),
-                    animation.Animation(torso_frames[7:8], 70),
-                    animation.Animation(arm_frames[7:8], 70),
-                    animation.Animation(head_frames[7:8], 70),
-                )
-            ),
-            "idle up": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[15:16], 70),
-                    animation.Animation(torso_frames[15:16], 70),
-                    animation.Animation(arm_frames[15:16], 70),
-                    animation.Animation(head_frames[15:16], 70),
-                )
-            ),
-            "idle right": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[23:24], 70),
-                    animation.Animation(torso_frames[23:24], 70),
-                    animation.Animation(arm_frames[23:24], 70),
-                    animation.Animation(head_frames[23:24], 70),
-                )
-            ),
-            "idle left": animation.MultiAnimation(
-                (
-                    animation.Animation(foot_frames[23:24], 70, mirror_x=True),
-                    animation.Animation(torso_frames[23:24], 70, mirror_x=True),
-                    animation.Animation(arm_frames[23:24], 70, mirror_x=True),
-                    animation.Animation(head_frames[23:24], 70, mirror_x=True),
-                )
-            ),
+            **get_outfit_anims(DEFAULT_OUTFIT),
         }
         super().__init__(
             arg.GameObjectArgs(id="player"),
             anim_dict=anim_dict,
             start_health=6,
             max_health=12,
-            hit_effect=effect.Flicker(1500),
+            hit_effect=effects.Flicker(1500),
             immunity=1500,
             initial_state="idle",
         )
@@ -161,6 +156,15 @@ class Player(base.MobileGameObject):
             physics.TYPE_DYNAMIC, self.registry.get_group("collision")
         )
 
+    def change_map(self, pos, layer, registry):
+        """Walk straight into another map, taking along anything carried"""
+        carrying = self.carrying
+        self.carrying = None
+        self.reset(pos, layer, registry, self.tiny)
+        if carrying is not None:
+            carrying.change_registry(registry)
+            self.carrying = carrying
+
     def heal_mp(self, mp):
         self.current_mana = pygame.math.clamp(
             self.current_mana + mp, 0, self.mana_capacity
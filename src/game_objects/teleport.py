@@ -41,7 +41,8 @@ class Teleport(entity.Entity):
             if globals.engine.current_map != self.dest_map:
                 globals.engine.load_map(self.dest_map, self.dest)
             else:
-                globals.player.pos = self.dest
+                # dest is in tiled's coordinates
+                globals.player.pos = self.dest + self.registry.tiled_origin
             globals.player.on_teleport()
 
 
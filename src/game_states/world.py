@@ -1,15 +1,92 @@
 import logging
 import os
+import statistics
+from collections import defaultdict
 
 import pygame
 
 import globals
 import gui
-from bush import event_binding, particle, sound, timer, util
+from bush import event_binding, particle, physics, sound, timer, util
 from bush.mapping import world
 from game_states import base, ui
 
 logger = logging.getLogger(__name__)
+# how far past the camera other maps are kept live when streaming, in pixels
+STREAM_MARGIN = 64
+# how close to the edge of its map the player also collides with the live
+# maps over the edge, in pixels
+SEAM_MARGIN = 16
+
+
+class WorldIndex:
+    """Grid over the maps of a world, for finding maps by position quickly.
+
+    Each map rect is filed under every grid cell it covers, so point and
+    rect lookups only look at the maps in the cells they touch.  Cells are
+    as big as the median map side, so a typical map covers a cell or so and
+    one very small map does not make the grid fine for all the others.
+    """
+
+    def __init__(self, name_to_rect):
+        self.rects = {name: pygame.Rect(rect) for name, rect in name_to_rect.items()}
+        self.order = {name: i for i, name in enumerate(self.rects)}
+        sides = [side for rect in self.rects.values() for side in rect.size if side]
+        self.cell_size = max(int(statistics.median(sides)), 1) if sides else 1
+        self.cells = defaultdict(list)  # (cell x, cell y): names, in world order
+        for name, rect in self.rects.items():
+            for cell in self.get_cells(rect):
+                self.cells[cell].append(name)
+
+    def get_cells(self, rect):
+        size = self.cell_size
+        return [
+            (x, y)
+            for y in range(rect.top // size, (rect.bottom - 1) // size + 1)
+            for x in range(rect.left // size, (rect.right - 1) // size + 1)
+        ]
+
+    def name_collidepoint(self, pos):
+        """Return the name of the map at a world position, or None"""
+        # truncated the way Rect.collidepoint does it
+        x, y = int(pos[0]), int(pos[1])
+        for name in self.cells.get((x // self.cell_size, y // self.cell_size), ()):
+            if self.rects[name].collidepoint(x, y):
+                return name
+        return None
+
+    def names_colliderect(self, rect):
+        """Return the names of the maps that overlap a world rect, in world order"""
+        rect = pygame.Rect(rect)
+        found = set()
+        for cell in self.get_cells(rect):
+            found.update(
+                name
+                for name in self.cells.get(cell, ())
+                if self.rects[name].colliderect(rect)
+            )
+        return sorted(found, key=self.order.get)
+
+    def get_neighbours(self, name):
+        """Return the names of the maps that touch the edges of a map"""
+        return [
+            other
+            for other in self.names_colliderect(self.rects[name].inflate(2, 2))
+            if other != name
+        ]
+
+
+class SeamCollider(pygame.sprite.Sprite):
+    """Stands in for a static collider of a live map, moved into the current map"""
+
+    def __init__(self, sprite, offset, group):
+        super().__init__(group)
+        self.rect = sprite.rect.move(offset)
+        self.physics_data = physics.PhysicsData(physics.TYPE_STATIC, group)
+        if hasattr(sprite, "mask"):
+            self.mask = sprite.mask
+        if hasattr(sprite, "rects"):
+            self.rects = [rect.move(offset) for rect in sprite.rects]
 
 
 class MapState(base.GameState):
@@ -50,7 +127,7 @@ class MapState(base.GameState):
                     )
             globals.player.event(event)
 
-    def draw(self, surface, draw_player=True, offset=(0, 0)):
+    def draw(self, surface, draw_player=True, offset=None):
         if not draw_player:
             self.main_group.remove(globals.player)
         self.main_group.draw(surface, offset)
@@ -60,14 +137,12 @@ class MapState(base.GameState):
                 surface,
                 (255, 0, 0),
                 globals.player.get_interaction_rect().move(
-                    -pygame.Vector2(self.main_group.cam_rect.topleft)
+                    -self.main_group.get_draw_camera()
                 ),
                 1,
             )
         self.sky.render(surface)
-        self.particle_manager.draw(
-            surface, -pygame.Vector2(self.main_group.cam_rect.topleft)
-        )
+        self.particle_manager.draw(surface, -self.main_group.get_draw_camera())
         super().draw(surface)
 
     def map_to_world(self, local_pos, map_name=None):
@@ -85,17 +160,30 @@ class WorldState(base.GameState):
     STATE_MAP = 0
     STATE_TRANSITIION = 1
 
-    def __init__(self, filename, map_loader, initial_map=None, initial_pos=None):
+    def __init__(
+        self, filename, map_loader, initial_map=None, initial_pos=None, streaming=False
+    ):
         # mapping
         self.world = world.World(self.loader.load(os.path.join("tiled/maps", filename)))
+        self.world_index = WorldIndex(self.world.name_to_rect)
         self.map_loader = map_loader
         self.map_properties = {}
+        # when streaming, maps around the camera are drawn and updated along
+        # with the current one, and crossing into them is instant
+        self.streaming = streaming
+        self.live_maps = {}  # name: LoadedMap, of maps other than the current one
+        self.loaded_map = None
         self.sky = globals.engine.sky
         self.particle_manager = particle.ParticleManager()
         self.registry = None
         self.main_group = None
         self.map_rect = None
         self.map_name = None
+        self.neighbour_paths = []  # maps touching the current one
+        # the player's collision group while it is near the edge of its map,
+        # with the colliders of the live maps over the edge added in
+        self.seam_group = pygame.sprite.Group()
+        self.seam_key = None  # what the seam group was made from
         self.state = self.STATE_MAP
         # transitions
         # map1 is the map to be transitioned out of
@@ -108,6 +196,9 @@ class WorldState(base.GameState):
         self.player_motion_ratio = None
         self.player_dest = None
         self.transition_timer = timer.Timer(0)
+        # (surface, topleft) of each map drawn once for the whole transition
+        self.map1_snapshot = None
+        self.map2_snapshot = None
         self.ambience = None
 
         hud = gui.UIGroup()
@@ -125,26 +216,49 @@ class WorldState(base.GameState):
         if initial_map is not None:
             self.load_map(initial_map)
         elif initial_pos is not None:
-            name = self.world.name_collidepoint(initial_pos)
-            player_pos = (
-                pygame.Vector2(initial_pos) - self.world.name_to_rect[name][0:2]
-            )
+            name = self.world_index.name_collidepoint(initial_pos)
+            player_pos = self.world_to_map(initial_pos, name)
             self.load_map(name)
             globals.player.pos = player_pos
         else:
-            self.load_map(self.world.name_collidepoint((0, 0)))
+            self.load_map(self.world_index.name_collidepoint((0, 0)))
 
         self.filename = filename
         self.reload_map()
 
     def load_map(self, map_name):
-        self.map_name = map_name
         self.registry, self.map_properties = self.map_loader(
             self.world.get_map_by_name(map_name)
         )
+        self.set_map(map_name)
+
+    def switch_map(self, map_name, world_pos):
+        """Move the player straight into a live map, at a world position"""
+        map_loader = globals.engine.map_loader
+        map_loader.remove_player(self.registry)
+        self.live_maps[self.map_name] = self.loaded_map
+        loaded = self.live_maps.pop(map_name, None)
+        if loaded is None:
+            loaded = map_loader.preload(self.world.get_map_by_name(map_name))
+        self.registry, self.map_properties = map_loader.switch(
+            loaded, self.world_to_map(world_pos, map_name)
+        )
+        # the player collides with the new map's group again
+        self.seam_group.empty()
+        self.seam_key = None
+        self.set_map(map_name)
+
+    def set_map(self, map_name):
+        self.map_name = map_name
+        self.loaded_map = globals.engine.map_loader.current_map
         self.map_rect = pygame.Rect(self.world.get_rect_by_name(map_name))
         self.main_group = self.registry.get_group("main")
         self.reload_map()
+        self.neighbour_paths = [
+            self.world.get_map_by_name(name)
+            for name in self.world_index.get_neighbours(map_name)
+        ]
+        globals.engine.map_loader.prefetch(self.neighbour_paths)
 
     def reload_map(self):
         reload_map(self.main_group)
@@ -154,9 +268,15 @@ class WorldState(base.GameState):
         sound.glob_player.switch_track(self.map_properties.get("track", None))
 
     def update_map(self):
+        """Move on to the map the player is going into, if it has changed
+
+        Returns whether the player may be outside of the current map's rect.
+        """
+        if self.streaming:
+            return self.stream_map()
         player_facing = util.string_direction_to_vec(globals.player.facing)
-        pos = player_facing * 16 + globals.player.pos + self.map_rect.topleft
-        new_map = self.world.name_collidepoint(pos)
+        pos = self.map_to_world(player_facing * 16 + globals.player.pos)
+        new_map = self.world_index.name_collidepoint(pos)
         if new_map not in {None, self.map_name}:
             logger.info(f"Switch map from {self.map_name} to {new_map}")
             self.state = self.STATE_TRANSITIION
@@ -183,6 +303,49 @@ class WorldState(base.GameState):
             ) / (self.map1_dest - self.map1_start).length()
             self.transition_timer = timer.Timer(1000, self.finish_transition)
             self.main_group.update(0)
+            # neither map is updated during the transition, so each one only
+            # needs drawing once
+            self.main_group.remove(globals.player)
+            self.map1_snapshot = self.snapshot(
+                self.map1_group, self.map1_start, self.map1_dest
+            )
+            self.map2_snapshot = self.snapshot(
+                self.main_group,
+                self.map1_start + self.map2_offset,
+                self.map1_dest + self.map2_offset,
+            )
+
+    def stream_map(self):
+        """Switch to the map under the player, keeping it where it is"""
+        world_pos = self.map_to_world(globals.player.pos)
+        world_rect = globals.player.rect.move(self.map_to_world((0, 0)))
+        new_map = self.world_index.name_collidepoint(world_pos)
+        if new_map not in {None, self.map_name}:
+            logger.info(f"Switch map from {self.map_name} to {new_map}")
+            self.switch_map(new_map, world_pos)
+            return True
+        # the player can stand over the edge of its map, as long as there is
+        # another map there
+        corners = (
+            world_rect.topleft,
+            (world_rect.right - 1, world_rect.top),
+            (world_rect.left, world_rect.bottom - 1),
+            (world_rect.right - 1, world_rect.bottom - 1),
+        )
+        return all(self.world_index.name_collidepoint(i) for i in corners)
+
+    @staticmethod
+    def snapshot(group, start, dest):
+        """Draw everything of a group that is shown between two draw offsets
+
+        Returns the surface, and the offset to add when blitting it in place
+        of drawing the group.
+        """
+        size = globals.engine.screen_size
+        area = pygame.Rect(-start, size).union(pygame.Rect(-dest, size))
+        surface = pygame.Surface(area.size, pygame.SRCALPHA)
+        group.draw(surface, offset=-pygame.Vector2(area.topleft))
+        return surface, pygame.Vector2(area.topleft)
 
     def finish_transition(self):
         self.state = self.STATE_MAP
@@ -195,6 +358,8 @@ class WorldState(base.GameState):
         self.player_offset = None
         self.player_dest = None
         self.transition_timer = timer.Timer(0)
+        self.map1_snapshot = None
+        self.map2_snapshot = None
         self.main_group.add(globals.player)
 
     def update(self, dt=0.03):
@@ -203,7 +368,84 @@ class WorldState(base.GameState):
         if self.state == self.STATE_MAP:
             self.sky.update(dt)
             self.particle_manager.update(dt)
+            if self.streaming:
+                self.update_seam_collision()
             self.main_group.update(dt)
+            if self.streaming:
+                self.update_live_maps(dt)
+
+    def update_live_maps(self, dt):
+        """Keep the maps the camera can (nearly) see loaded, and update them
+
+        A map is only made live once it has been parsed in the background,
+        and only one is built a frame, so that the game never stops to load
+        a map the player is not in yet.
+        """
+        map_loader = globals.engine.map_loader
+        camera = self.main_group.cam_rect.move(self.map_to_world((0, 0)))
+        view = camera.inflate(STREAM_MARGIN * 2, STREAM_MARGIN * 2)
+        names = [
+            name
+            for name in self.world_index.names_colliderect(view)
+            if name != self.map_name
+        ]
+        waiting = []
+        built = False
+        for name in names:
+            if name in self.live_maps:
+                continue
+            path = self.world.get_map_by_name(name)
+            if not built and map_loader.is_ready(path):
+                self.live_maps[name] = map_loader.preload(path)
+                built = True
+            else:
+                waiting.append(path)
+        if waiting:
+            map_loader.prefetch(self.neighbour_paths + waiting)
+        self.live_maps = {
+            name: self.live_maps[name] for name in names if name in self.live_maps
+        }
+        for loaded in self.live_maps.values():
+            loaded.registry.get_group("main").update(dt)
+
+    def update_seam_collision(self):
+        """Let the player collide with the live maps it may step over the edge into
+
+        Near the edge of its map, the player is given a collision group with
+        the static colliders of the live maps there, moved into the current
+        map.  It is only made again when the maps or their colliders change.
+        """
+        collision_group = self.registry.get_group("collision")
+        reach = globals.player.rect.inflate(SEAM_MARGIN * 2, SEAM_MARGIN * 2)
+        key = None
+        if not pygame.Rect((0, 0), self.map_rect.size).contains(reach):
+            names = [
+                name
+                for name in self.world_index.names_colliderect(
+                    reach.move(self.map_to_world((0, 0)))
+                )
+                if name in self.live_maps
+            ]
+            if names:
+                key = (self.map_name, len(collision_group)) + tuple(
+                    (name, len(self.live_maps[name].registry.get_group("collision")))
+                    for name in names
+                )
+        if key == self.seam_key:
+            return
+        self.seam_key = key
+        self.seam_group.empty()
+        if key is None:
+            globals.player.change_collision_group(collision_group)
+            return
+        self.seam_group.add(collision_group.sprites())
+        for name in names:
+            offset = self.map_to_world((0, 0), name) - self.map_to_world((0, 0))
+            for sprite in self.live_maps[name].registry.get_group("collision"):
+                if sprite.physics_data.type == physics.TYPE_STATIC:
+                    SeamCollider(sprite, offset, self.seam_group)
+        physics.optimize_for_physics(self.seam_group)
+        globals.player.change_collision_group(self.seam_group)
 
     def handle_events(self):
         for event in pygame.event.get():
@@ -215,27 +457,29 @@ class WorldState(base.GameState):
                     )
             globals.player.event(event)
 
-    def draw(self, surface, offset=(0, 0)):
+    def draw(self, surface, offset=None):
         if self.state == self.STATE_MAP:
-            self.main_group.draw(surface, offset)
+            if self.live_maps:
+                self.draw_live_maps(surface, offset)
+            else:
+                self.main_group.draw(surface, offset)
             if self.main_group.debug_physics:
                 pygame.draw.rect(
                     surface,
                     (255, 0, 0),
                     globals.player.get_interaction_rect().move(
-                        -pygame.Vector2(self.main_group.cam_rect.topleft)
+                        -self.main_group.get_draw_camera()
                     ),
                     1,
                 )
-            self.particle_manager.draw(
-                surface, -pygame.Vector2(self.main_group.cam_rect.topleft)
-            )
+            self.particle_manager.draw(surface, -self.main_group.get_draw_camera())
         else:
-            self.main_group.remove(globals.player)
             percent_complete = self.transition_timer.percent_complete()
             map1_pos = self.map1_start.lerp(self.map1_dest, percent_complete)
-            self.map1_group.draw(surface, offset=map1_pos)
-            self.main_group.draw(surface, offset=map1_pos + self.map2_offset)
+            map1_surface, map1_topleft = self.map1_snapshot
+            surface.blit(map1_surface, map1_pos + map1_topleft)
+            map2_surface, map2_topleft = self.map2_snapshot
+            surface.blit(map2_surface, map1_pos + self.map2_offset + map2_topleft)
             surface.blit(
                 globals.player.image,
                 self.map1_start.lerp(
@@ -246,11 +490,41 @@ class WorldState(base.GameState):
         self.sky.render(surface)
         super().draw(surface)
 
+    def draw_live_maps(self, surface, offset=None):
+        """Draw the current map and the live maps around it, layer by layer
+
+        On each layer the live maps are drawn first, so that the ground of a
+        neighbour never covers anything on the current map.
+        """
+        if offset is None:
+            camera = self.main_group.get_draw_camera()
+        else:
+            camera = -pygame.Vector2(offset)
+        camera = self.map_to_world(camera)
+        groups = [
+            (
+                loaded.registry.get_group("main"),
+                self.map_to_world((0, 0), name) - camera,
+            )
+            for name, loaded in self.live_maps.items()
+        ]
+        groups.append((self.main_group, offset))
+        group_layers = [set(group.layers()) for group, _ in groups]
+        for layer in sorted(set().union(*group_layers)):
+            for (group, group_offset), layers in zip(groups, group_layers):
+                if layer in layers:
+                    group.draw(surface, group_offset, layers={layer})
+
     def map_to_world(self, local_pos, map_name=None):
         if map_name is None:
             map_name = self.map_name
         return pygame.Vector2(local_pos) + self.world.name_to_rect[map_name][:2]
 
+    def world_to_map(self, world_pos, map_name=None):
+        if map_name is None:
+            map_name = self.map_name
+        return pygame.Vector2(world_pos) - self.world.name_to_rect[map_name][:2]
+
 
 def reload_map(sprite_group):
     for sprite in sprite_group.sprites():
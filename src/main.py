@@ -14,6 +14,7 @@ from bush import asset_handler
 asset_handler.AssetHandler.set_global_home("assets")
 
 import custom_mapper
+import effects
 import globals
 import gui
 import menu
@@ -28,6 +29,9 @@ logging.basicConfig(level=logging.DEBUG)
 loader = asset_handler.glob_loader
 logger = logging.getLogger(__name__)
 START_SPOTS = None
+# worlds whose neighbouring maps are kept live around the camera, instead of
+# being transitioned to
+STREAMING_WORLDS = {"overworld.world"}
 
 
 class Game:
@@ -38,6 +42,13 @@ class Game:
         self.screen = None
         self.clock = pygame.time.Clock()
         self.fps = 30 * (not util.is_pygbag())  # no framerate limiting on browser
+        # the game is updated in fixed steps, no matter the framerate
+        # steps per second, one a frame unless frames are slow (or uncapped)
+        self.tick_rate = self.fps or 30
+        self.max_steps = 5  # most steps run in one frame to catch up
+        self.accumulator = 0  # time not yet simulated
+        self.interpolation = 1  # how far between the last two steps to draw
+        self.simulated_state = None
         self.running = False
         self.bgcolor = (20, 27, 27)
         self.cursor = None
@@ -101,17 +112,21 @@ class Game:
         groups, properties = self.map_loader.load(tmx_path, player_pos)
         self.stack.push(world.MapState(tmx_path, groups, properties))
 
-    def load_world(self, world_path, player_pos=None):
+    def load_world(self, world_path, player_pos=None, streaming=None):
         """Load world at given path, relative to the "tiled" asset directory.
 
         If the player position is given the player will spawn there.  Else it will use the default specified by the map
+        If streaming is set, neighbouring maps are kept live instead of transitioned to.  By default worlds in STREAMING_WORLDS are streamed
         """
-        logger.info(f"loading world '{world_path}'")
+        if streaming is None:
+            streaming = world_path in STREAMING_WORLDS
+        logger.info(f"loading world '{world_path}' (streaming: {streaming})")
         self.stack.push(
             world.WorldState(
                 world_path,
                 functools.partial(self.map_loader.load, player_pos=player_pos),
                 initial_pos=player_pos,
+                streaming=streaming,
             )
         )
 
@@ -191,12 +206,13 @@ class Game:
                     1,
                     self.stack.get_current().gui,
                 )
-            current_state.update(dt)
+            self.simulate(current_state, dt)
             self.cursor_group.update(dt)
             self.screen.fill(self.bgcolor)
             current_state.draw(self.screen)
             self.cursor_group.draw(self.screen)
             current_state.handle_events()
+            effects.frame_cache.next_frame()
             pygame.display.flip()
             await asyncio.sleep(0)
             dt = self.tick()
@@ -207,6 +223,29 @@ class Game:
         pygame.quit()
         self.screen = None
 
+    def simulate(self, current_state, dt):
+        """Update the current state in fixed steps for the time passed.
+
+        Time left over is carried to the next frame, and sets how far between
+        the last two steps the frame is drawn.  If the game falls too far
+        behind the extra time is dropped.
+        """
+        step = 1 / self.tick_rate
+        if current_state is not self.simulated_state:
+            # new states get an update before they are first drawn
+            self.simulated_state = current_state
+            current_state.update(0)
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= step:
+            if steps == self.max_steps or self.stack.get_current() is not current_state:
+                self.accumulator %= step
+                break
+            current_state.update(step)
+            self.accumulator -= step
+            steps += 1
+        self.interpolation = self.accumulator / step
+
     def quit(self):
         """Exit game, if allowed on current platform"""
         logger.warning(f"Game quit with state stack {self.stack}")
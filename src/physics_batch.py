@@ -0,0 +1,235 @@
+"""
+Batched physics for the mobile objects of a map.
+
+Normally every MobileGameObject works out its own velocity, terrain and
+knockback in update_physics, one Vector2 at a time.  With BATCH_PHYSICS on
+(and numpy installed), each map's main group gets a PhysicsBatch instead.
+Objects only queue themselves while the group updates, and once it is done
+the batch integrates all of them at once.
+
+Every object keeps a row in the batch's arrays for as long as it is in the
+group, so its velocity and terrain live there between frames.  Terrain is
+looked up straight from the map's TerrainGrid for every object at once,
+falling back to the object's own lookup where the grid can't tell (partial
+tiles, big objects, the edges of the map and infinite maps).  Only objects
+that end up moving go through collision (physics.dynamic_update).
+
+As physics is worked out after the whole group has updated, objects (and
+their scripts) only see their new velocity and position on the next frame.
+The player never waits on this, as the camera follows it.
+"""
+import pygame
+
+try:
+    import numpy
+except ImportError:  # optional, only needed for batched physics
+    numpy = None
+
+import environment
+from bush import physics
+
+# work out the physics of a map's mobile objects at once (needs numpy)
+BATCH_PHYSICS = False
+
+
+def make_batch(registry):
+    """Return a PhysicsBatch for a registry, or None if physics isn't batched"""
+    if BATCH_PHYSICS and numpy is not None:
+        return PhysicsBatch(registry)
+    return None
+
+
+class PhysicsBatch:
+    """The physics state of a map's mobile objects, one row per object"""
+
+    # arrays with a row per object, and the shape of a row
+    FIELDS = {
+        "desired": ((2,), float),  # desired velocity (after mobility)
+        "velocity": ((2,), float),
+        "force": ((2,), float),
+        "rects": ((4,), int),  # collision rect, as (x, y, width, height)
+        "speed": ((), float),  # terrain factors
+        "traction": ((), float),
+        "moving": ((), bool),  # moved last frame
+    }
+
+    def __init__(self, registry, capacity=32):
+        self.registry = registry
+        self.sprites = []
+        self.rows = {}  # sprite: row
+        self.queued = []  # sprites to integrate this frame
+        for name, (shape, dtype) in self.FIELDS.items():
+            setattr(self, name, numpy.zeros((capacity, *shape), dtype))
+        self.grid = None  # TerrainGrid the lookup tables are for
+        self.grid_names = 0  # how many terrain names the tables cover
+        self.cells = self.partial = None
+        self.ranks = self.speeds = self.tractions = None
+
+    def add(self, sprite):
+        row = len(self.sprites)
+        if row == len(self.moving):
+            for name in self.FIELDS:
+                array = getattr(self, name)
+                grown = numpy.zeros((row * 2, *array.shape[1:]), array.dtype)
+                grown[:row] = array
+                setattr(self, name, grown)
+        self.sprites.append(sprite)
+        self.rows[sprite] = row
+        self.velocity[row] = tuple(sprite.velocity)[:2]
+        self.moving[row] = any(self.velocity[row])
+        return row
+
+    def remove(self, sprite):
+        """Forget a sprite, moving the last row into its place"""
+        row = self.rows.pop(sprite, None)
+        if row is None:
+            return
+        last = len(self.sprites) - 1
+        if row != last:
+            for name in self.FIELDS:
+                array = getattr(self, name)
+                array[row] = array[last]
+            self.sprites[row] = self.sprites[last]
+            self.rows[self.sprites[row]] = row
+        self.sprites.pop()
+        if sprite in self.queued:
+            self.queued.remove(sprite)
+
+    def queue(self, sprite):
+        """Integrate an object once the group is done updating"""
+        self.queued.append(sprite)
+
+    def get_tables(self, grid):
+        """Make the lookup tables for a TerrainGrid's terrains, if out of date"""
+        if grid is self.grid and len(grid.names) == self.grid_names:
+            return
+        self.grid = grid
+        self.grid_names = len(grid.names)
+        self.cells = numpy.frombuffer(grid.cells, numpy.uint8)
+        self.partial = numpy.frombuffer(grid.partial, numpy.uint8)
+        order = environment.TERRAIN_ORDER
+        ranks = []
+        terrains = []
+        for name in grid.names:
+            # same as TerrainGrid.get_in_rect
+            rank = order.index(name) if name in order else len(order)
+            ranks.append(rank)
+            terrains.append(
+                environment.TERRAIN_DATA[name if rank < len(order) else "default"]
+            )
+        # ids not in names are never in the grid
+        self.ranks = numpy.full(256, len(order) + 1)
+        self.ranks[: len(ranks)] = ranks
+        self.speeds = numpy.zeros(256)
+        self.speeds[: len(terrains)] = [terrain.speed for terrain in terrains]
+        self.tractions = numpy.zeros(256)
+        self.tractions[: len(terrains)] = [terrain.traction for terrain in terrains]
+
+    def update_terrain(self, rows):
+        """Look up the terrain factors of the objects in rows"""
+        grid = self.registry.terrain_grid
+        slow = rows
+        if isinstance(grid, environment.TerrainGrid):
+            self.get_tables(grid)
+            x, y, width, height = self.rects[rows].T
+            left, top = x // grid.tile_width, y // grid.tile_height
+            right = (x + width - 1) // grid.tile_width
+            bottom = (y + height - 1) // grid.tile_height
+            # objects at most two tiles across, inside of the map
+            fast = (
+                (width > 0)
+                & (height > 0)
+                & (right - left <= 1)
+                & (bottom - top <= 1)
+                & (left >= 0)
+                & (top >= 0)
+                & (right < grid.width)
+                & (bottom < grid.height)
+            )
+            corners = numpy.stack(
+                (
+                    top * grid.width + left,
+                    top * grid.width + right,
+                    bottom * grid.width + left,
+                    bottom * grid.width + right,
+                ),
+                axis=1,
+            )[fast]
+            # tiles only partly covered need the terrain masks
+            whole = ~self.partial[corners].any(axis=1)
+            fast[fast] = whole
+            corners = corners[whole]
+            ids = self.cells[corners]
+            best = ids[numpy.arange(len(ids)), self.ranks[ids].argmin(axis=1)]
+            self.speed[rows[fast]] = self.speeds[best]
+            self.traction[rows[fast]] = self.tractions[best]
+            slow = rows[~fast]
+        for row in slow.tolist():
+            terrain = self.sprites[row].get_current_environment()
+            self.speed[row] = terrain.speed
+            self.traction[row] = terrain.traction
+
+    def run(self, dt):
+        """Integrate every queued object, and collide the ones that move"""
+        sprites, self.queued = self.queued, []
+        if not sprites:
+            return
+        get_row = self.rows.get
+        rows = [get_row(sprite) for sprite in sprites]
+        if None in rows:
+            rows = [
+                self.add(sprite) if row is None else row
+                for sprite, row in zip(sprites, rows)
+            ]
+        rows = numpy.array(rows)
+        # every object's inputs in one go, as filling rows one by one is slow
+        inputs = numpy.array(
+            [
+                (*sprite.desired_velocity, *sprite.force, *sprite.collision_rect)
+                for sprite in sprites
+            ]
+        )
+        self.desired[rows] = inputs[:, 0:2]
+        self.force[rows] = inputs[:, 2:4]
+        self.rects[rows] = inputs[:, 4:8]
+        self.update_terrain(rows)
+
+        desired = self.desired[rows]
+        velocity = self.velocity[rows]
+        force = self.force[rows]
+        speed = self.speed[rows, None]
+        traction = self.traction[rows, None]
+        pushed = force.any(axis=1)
+        # slippety-slide!
+        velocity = numpy.where(
+            traction != 1,
+            velocity + desired * speed * traction,
+            desired * speed,
+        )
+        force *= 1.5 - traction
+        velocity += force
+        moved = velocity.any(axis=1)
+        stopped = self.moving[rows] & ~moved
+        self.velocity[rows] = velocity
+        self.force[rows] = force
+        self.moving[rows] = moved
+
+        # only objects whose physics changed need anything written back
+        changed = numpy.flatnonzero(moved | stopped | pushed)
+        collided = []
+        for index, sprite_force, sprite_velocity, moves in zip(
+            changed.tolist(),
+            force[changed].tolist(),
+            velocity[changed].tolist(),
+            moved[changed].tolist(),
+        ):
+            sprite = sprites[index]
+            sprite.force.update(sprite_force)
+            sprite.velocity = pygame.Vector2(sprite_velocity)
+            if moves:
+                physics.dynamic_update(sprite, dt)
+                sprite.update_rects()
+                collided.append(tuple(sprite.velocity)[:2])
+        if collided:
+            # collision can stop objects
+            self.velocity[rows[changed[moved[changed]]]] = collided
@@ -0,0 +1,408 @@
+"""
+Precompiled binary cache for TMX maps.
+
+Parsing a .tmx file means parsing XML for the map and every .tsx it
+references.  This module does that once and writes the result to a packed
+blob next to the map (in a `__tmxcache__` directory, much like python does
+with .pyc files).  Later loads map the blob with mmap, so the gid grids of
+the tile layers are used straight from the file without being copied.
+
+Blob layout (native byte order)::
+
+    header   magic, version, index size, meta size, blob size, checksum
+    index    pickled dict: source stamps, load options, section offsets
+    meta     pickled TiledMap, minus images and tile layer data
+    (padding to 4 bytes)
+    grids    raw gids of every tile layer (or chunk), one after another
+    atlas    (gid, tileset, flags, x, y, w, h) record per tile image
+
+Section offsets in the index are relative to the start of the grids.
+
+The cache is thrown out whenever the size or contents (crc32) of the .tmx
+or any of its .tsx files change.  Sources are recorded relative to the map,
+so blobs survive the tree being moved.  Blobs of another version, of the wrong
+length (left over from an interrupted write) or whose index and meta do not
+match their checksum are never unpickled.
+
+Maps can be compiled ahead of time from the `src` directory with::
+
+    python -m pytmx.compiled assets/tiled/maps/*.tmx
+
+"""
+import argparse
+import io
+import logging
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import mmap
+except ImportError:  # some web runtimes do not ship mmap
+    mmap = None
+
+from .pytmx import (
+    GID_TYPECODE,
+    TiledMap,
+    TiledTileLayer,
+    TileFlags,
+    default_image_loader,
+)
+
+__all__ = ["compile_map", "read_map", "load_map", "get_cache_path"]
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TMXC"
+VERSION = 6
+CACHE_DIRECTORY = "__tmxcache__"
+CACHE_EXTENSION = ".tmxc"
+
+HEADER = struct.Struct("=4sIIIQI")
+ATLAS_RECORD = struct.Struct("=IHBHHHH")
+
+# options that change the parsed result, so are part of the cache key
+PARSE_OPTIONS = ("load_all", "invert_y", "allow_duplicate_names")
+
+# every combination of flip flags, indexed by bit
+ALL_FLAGS = tuple(TileFlags(bool(i & 1), bool(i & 2), bool(i & 4)) for i in range(8))
+
+
+def get_cache_path(filename: str) -> str:
+    """Return the path of the compiled blob for a .tmx file.
+
+    Args:
+        filename (str): Path of the .tmx file.
+
+    Returns:
+        str: Path of the blob.
+
+    """
+    directory, name = os.path.split(filename)
+    return os.path.join(directory, CACHE_DIRECTORY, name + CACHE_EXTENSION)
+
+
+def _source_stamps(tiled_map: TiledMap) -> dict:
+    """Return the sizes and checksums of every file the map was parsed from
+
+    Paths are relative to the map's directory, so blobs still match their
+    sources when the whole tree is moved or bundled.
+    """
+    directory = os.path.dirname(os.path.abspath(tiled_map.filename))
+    paths = [tiled_map.filename]
+    paths.extend(ts.filename for ts in tiled_map.tilesets if ts.filename)
+    return {
+        os.path.relpath(os.path.abspath(path), directory): _stamp(path)
+        for path in paths
+    }
+
+
+def _stamp(path: str):
+    with open(path, "rb") as file:
+        data = file.read()
+    return len(data), zlib.crc32(data)
+
+
+def _is_fresh(index: dict, options: dict, filename: str) -> bool:
+    if index.get("options") != options:
+        return False
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        return all(
+            _stamp(os.path.join(directory, path)) == stamp
+            for path, stamp in index["sources"].items()
+        )
+    except OSError:
+        return False
+
+
+def _parse_options(kwargs: dict) -> dict:
+    return {key: kwargs[key] for key in PARSE_OPTIONS if key in kwargs}
+
+
+def _get_grids(layers: List[TiledTileLayer]) -> list:
+    """Return (gids, rows, width) of every gid grid in the layers"""
+    grids = list()
+    for layer in layers:
+        if layer.chunks:
+            grids.extend((i.gids, i.data, i.width) for i in layer.chunks.values())
+        else:
+            grids.append((layer.gids, layer.data, layer.width))
+    return grids
+
+
+def _pack_flags(flags) -> int:
+    if not flags:
+        return 0
+    return (
+        flags.flipped_horizontally
+        | flags.flipped_vertically << 1
+        | flags.flipped_diagonally << 2
+    )
+
+
+class _MapPickler(pickle.Pickler):
+    """Pickles a TiledMap, leaving out the parts that go in other sections"""
+
+    def __init__(self, file, tiled_map: TiledMap, grids: list):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.external = {id(tiled_map.images): ("images",)}
+        self.external[id(tiled_map.image_loader)] = ("image_loader",)
+        for i, (gids, rows, _) in enumerate(grids):
+            self.external[id(gids)] = ("gids", i)
+            self.external[id(rows)] = ("rows", i)
+
+    def persistent_id(self, obj):
+        return self.external.get(id(obj), None)
+
+
+class _MapUnpickler(pickle.Unpickler):
+    """Resolves the parts of the map left out by _MapPickler"""
+
+    def __init__(self, file, buffer, grids, image_loader):
+        super().__init__(file)
+        self.buffer = buffer
+        self.grids = grids
+        self.image_loader = image_loader
+
+    def get_gids(self, i):
+        offset, count, _ = self.grids[i]
+        return self.buffer[offset : offset + count * 4].cast(GID_TYPECODE)
+
+    def persistent_load(self, pid):
+        kind = pid[0]
+        if kind == "images":
+            return list()
+        if kind == "image_loader":
+            return self.image_loader
+        if kind == "gids":
+            return self.get_gids(pid[1])
+        if kind == "rows":
+            width = self.grids[pid[1]][2]
+            view = self.get_gids(pid[1])
+            return [view[i : i + width] for i in range(0, len(view), width)]
+        raise pickle.UnpicklingError(f"unknown persistent id {pid}")
+
+
+def compile_map(
+    filename: str, cache_path: Optional[str] = None, **kwargs
+) -> Tuple[TiledMap, list]:
+    """Parse a .tmx file and write its compiled blob.
+
+    Args:
+        filename (str): Path of the .tmx file.
+        cache_path (Optional[str]): Where to write the blob.  Defaults to `get_cache_path`.
+        **kwargs: Passed on to TiledMap.
+
+    Returns:
+        Tuple[TiledMap, list]: The parsed map, without images loaded, and its tile atlas.
+
+    Raises:
+        OSError: if the blob cannot be written.
+
+    """
+    if cache_path is None:
+        cache_path = get_cache_path(filename)
+    kwargs["image_loader"] = default_image_loader
+    tiled_map = TiledMap(filename, **kwargs)
+    atlas = tiled_map.build_tile_atlas()
+    layers = [i for i in tiled_map.layers if isinstance(i, TiledTileLayer)]
+    grids = _get_grids(layers)
+
+    meta = io.BytesIO()
+    _MapPickler(meta, tiled_map, grids).dump(tiled_map)
+    meta = meta.getvalue()
+
+    grid_index = list()
+    grid_size = 0
+    for gids, _, width in grids:
+        grid_index.append((grid_size, len(gids), width))
+        grid_size += len(gids) * 4
+    index = pickle.dumps(
+        {
+            "byteorder": sys.byteorder,
+            "sources": _source_stamps(tiled_map),
+            "options": _parse_options(kwargs),
+            "grids": grid_index,
+            "atlas": (grid_size, len(atlas)),
+        },
+        pickle.HIGHEST_PROTOCOL,
+    )
+
+    data_start = HEADER.size + len(index) + len(meta)
+    data_start += -data_start % 4
+    blob_size = data_start + grid_size + len(atlas) * ATLAS_RECORD.size
+    checksum = zlib.crc32(meta, zlib.crc32(index))
+
+    directory = os.path.dirname(cache_path)
+    os.makedirs(directory, exist_ok=True)
+    # a unique temporary file, as a map can be compiled on two threads at once
+    handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(
+                HEADER.pack(MAGIC, VERSION, len(index), len(meta), blob_size, checksum)
+            )
+            file.write(index)
+            file.write(meta)
+            file.write(bytes(-file.tell() % 4))
+            for gids, _, _ in grids:
+                file.write(gids.tobytes())
+            for gid, ts_index, rect, flags in atlas:
+                file.write(ATLAS_RECORD.pack(gid, ts_index, _pack_flags(flags), *rect))
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    logger.debug(f"compiled map {filename} to {cache_path}")
+
+    return tiled_map, atlas
+
+
+def _read_buffer(cache_path: str) -> memoryview:
+    with open(cache_path, "rb") as file:
+        if mmap is None:
+            return memoryview(bytearray(file.read()))
+        # copy on write, so tile layer data can still be edited in memory
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY))
+
+
+def _load_blob(filename: str, cache_path: str, image_loader, options: dict):
+    """Return the map and atlas stored in a blob, or None if missing or stale"""
+    try:
+        buffer = _read_buffer(cache_path)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, version, index_size, meta_size, blob_size, checksum = HEADER.unpack_from(
+            buffer
+        )
+        if magic != MAGIC or version != VERSION:
+            return None
+        if len(buffer) != blob_size:
+            logger.warning(f"discarding truncated map cache {cache_path}")
+            return None
+        meta_start = HEADER.size + index_size
+        if zlib.crc32(buffer[HEADER.size : meta_start + meta_size]) != checksum:
+            logger.warning(f"discarding corrupt map cache {cache_path}")
+            return None
+        index = pickle.loads(buffer[HEADER.size : meta_start])
+        if index["byteorder"] != sys.byteorder or not _is_fresh(
+            index, options, filename
+        ):
+            return None
+        data = buffer[meta_start + meta_size + (-(meta_start + meta_size) % 4) :]
+        tiled_map = _MapUnpickler(
+            io.BytesIO(buffer[meta_start : meta_start + meta_size]),
+            data,
+            index["grids"],
+            image_loader,
+        ).load()
+        offset, count = index["atlas"]
+        atlas = [
+            (gid, ts_index, (x, y, w, h), ALL_FLAGS[flags])
+            for gid, ts_index, flags, x, y, w, h in ATLAS_RECORD.iter_unpack(
+                data[offset : offset + count * ATLAS_RECORD.size]
+            )
+        ]
+    except (struct.error, pickle.UnpicklingError, EOFError, KeyError) as error:
+        logger.warning(f"discarding corrupt map cache {cache_path}: {error}")
+        return None
+
+    # tilesets are found next to the map, wherever it is now
+    old_directory = os.path.dirname(tiled_map.filename)
+    directory = os.path.dirname(filename)
+    for tileset in tiled_map.tilesets:
+        if tileset.filename:
+            tileset.filename = os.path.normpath(
+                os.path.join(
+                    directory, os.path.relpath(tileset.filename, old_directory)
+                )
+            )
+    tiled_map.filename = filename
+    return tiled_map, atlas
+
+
+def read_map(
+    filename: str,
+    image_loader=default_image_loader,
+    cache_path: Optional[str] = None,
+    **kwargs,
+) -> Tuple[TiledMap, list]:
+    """Read a .tmx map through its compiled blob, compiling it if needed.
+
+    Images are not loaded, so this never calls the image loader and can be
+    run on a background thread.  Pass the result to TiledMap.load_images
+    to finish loading the map.
+
+    If the blob cannot be written (read only or web filesystems) the map
+    is still parsed and returned, it just won't be any faster next time.
+
+    Args:
+        filename (str): Path of the .tmx file.
+        image_loader: Image loader used for the tiles, as for TiledMap.
+        cache_path (Optional[str]): Where the blob lives.  Defaults to `get_cache_path`.
+        **kwargs: Passed on to TiledMap.
+
+    Returns:
+        Tuple[TiledMap, list]: The map, without images, and its tile atlas.
+
+    """
+    if cache_path is None:
+        cache_path = get_cache_path(filename)
+    options = _parse_options(kwargs)
+
+    loaded = _load_blob(filename, cache_path, image_loader, options)
+    if loaded is None:
+        try:
+            loaded = compile_map(filename, cache_path, **kwargs)
+        except OSError as error:
+            logger.warning(f"could not write map cache {cache_path}: {error}")
+            kwargs["image_loader"] = default_image_loader
+            tiled_map = TiledMap(filename, **kwargs)
+            loaded = tiled_map, tiled_map.build_tile_atlas()
+        loaded[0].image_loader = image_loader
+    return loaded
+
+
+def load_map(
+    filename: str,
+    image_loader=default_image_loader,
+    cache_path: Optional[str] = None,
+    **kwargs,
+) -> TiledMap:
+    """Load a .tmx map through its compiled blob, compiling it if needed.
+
+    Args:
+        filename (str): Path of the .tmx file.
+        image_loader: Image loader used for the tiles, as for TiledMap.
+        cache_path (Optional[str]): Where the blob lives.  Defaults to `get_cache_path`.
+        **kwargs: Passed on to TiledMap.
+
+    Returns:
+        TiledMap: The loaded map, with images.
+
+    """
+    tiled_map, atlas = read_map(filename, image_loader, cache_path, **kwargs)
+    tiled_map.load_images(atlas)
+    return tiled_map
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compile .tmx maps to blobs")
+    parser.add_argument("maps", nargs="+", help=".tmx files to compile")
+    for filename in parser.parse_args(args).maps:
+        compile_map(filename)
+        print(f"{filename} -> {get_cache_path(filename)}")
+
+
+if __name__ == "__main__":
+    main()
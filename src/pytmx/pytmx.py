@@ -23,14 +23,16 @@ import gzip
 import json
 import logging
 import os
-import struct
+import sys
+import threading
 import zlib
+from array import array
 from base64 import b64decode
-from collections import defaultdict, namedtuple
+from bisect import bisect_right, insort
+from collections import OrderedDict, defaultdict, namedtuple
 from copy import deepcopy
 from itertools import chain, product
 from math import cos, radians, sin
-from operator import attrgetter
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from xml.etree import ElementTree
 
@@ -50,6 +52,8 @@ __all__ = (
     "TiledTileLayer",
     "TiledClassType",
     "TiledTileset",
+    "TileChunk",
+    "TileImages",
     "convert_to_bool",
     "resolve_to_class",
     "parse_properties",
@@ -68,6 +72,13 @@ GID_TRANS_FLIPY = 1 << 30
 GID_TRANS_ROT = 1 << 29
 GID_MASK = GID_TRANS_FLIPX | GID_TRANS_FLIPY | GID_TRANS_ROT
 
+# array typecode for an unsigned 32 bit gid.  "I" is 32 bits on every
+# platform we ship to, but the C standard only promises 16.
+GID_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+# maps and tilesets with these extensions are read as tiled json
+JSON_EXTENSIONS = (".tmj", ".tsj", ".json")
+
 
 # error message format strings go here
 duplicate_name_fmt = (
@@ -77,6 +88,8 @@ duplicate_name_fmt = (
 flag_names = ("flipped_horizontally", "flipped_vertically", "flipped_diagonally")
 
 AnimationFrame = namedtuple("AnimationFrame", ["gid", "duration"])
+# piece of an infinite map layer.  x and y are in tiles, data is indexed [y][x]
+TileChunk = namedtuple("TileChunk", ["x", "y", "width", "height", "gids", "data"])
 Point = namedtuple("Point", ["x", "y"])
 TileFlags = namedtuple("TileFlags", flag_names)
 empty_flags = TileFlags(False, False, False)
@@ -134,27 +147,31 @@ def decode_gid(raw_gid: int) -> Tuple[int, TileFlags]:
 
 
 def reshape_data(
-    gids: List[int],
+    gids: array,
     width: int,
-) -> List[List[int]]:
-    """Change 1D list to 2d list
+) -> List[memoryview]:
+    """Change 1D gid array to 2d rows
+
+    The rows are memoryview slices into `gids`, so no data is copied and
+    writing to a row writes through to the flat array.
 
     Args:
-        gids (List[int]): List of gid ints.
+        gids (array): Flat array of gid ints.
         width (int): Width of each row.
 
     Returns:
-        List[List[int]]: 2D nested list object.
+        List[memoryview]: List of rows, indexable as data[y][x].
 
     """
-    return [gids[i : i + width] for i in range(0, len(gids), width)]
+    view = memoryview(gids)
+    return [view[i : i + width] for i in range(0, len(gids), width)]
 
 
 def unpack_gids(
     text: str,
     encoding: Optional[str] = None,
     compression: Optional[str] = None,
-) -> List[int]:
+) -> array:
     """Return all gids from encoded/compressed layer data
 
     Args:
@@ -163,7 +180,7 @@ def unpack_gids(
         compression (Optional[str]): Compression used.
 
     Returns:
-        List[int]: List of all the GIDs in the layer.
+        array: Flat array of all the GIDs in the layer.
 
     """
     if encoding == "base64":
@@ -174,14 +191,40 @@ def unpack_gids(
             data = zlib.decompress(data)
         elif compression:
             raise ValueError(f"layer compression {compression} is not supported.")
-        fmt = "<%dL" % (len(data) // 4)
-        return list(struct.unpack(fmt, data))
+        gids = array(GID_TYPECODE)
+        gids.frombytes(data[: len(data) - len(data) % 4])
+        # tiled always writes little endian
+        if sys.byteorder == "big":
+            gids.byteswap()
+        return gids
     elif encoding == "csv":
-        return [int(i) for i in text.split(",")]
+        return array(GID_TYPECODE, map(int, text.split(",")))
     elif encoding:
         raise ValueError(f"layer encoding {encoding} is not supported.")
 
 
+def read_gids(
+    node: ElementTree.Element,
+    encoding: Optional[str] = None,
+    compression: Optional[str] = None,
+) -> array:
+    """Return all gids from a <data> or <chunk> node, from tmx or json.
+
+    Args:
+        node (ElementTree.Element): The node.
+        encoding (Optional[str]): Encoding used.
+        compression (Optional[str]): Compression used.
+
+    Returns:
+        array: Flat array of all the GIDs in the node.
+
+    """
+    gids = getattr(node, "gids", None)
+    if gids is not None:
+        return array(GID_TYPECODE, gids)
+    return unpack_gids(node.text.strip(), encoding, compression)
+
+
 def convert_to_bool(value: str) -> bool:
     """Convert a few common variations of "true" and "false" to boolean
 
@@ -274,6 +317,7 @@ types.update(
         "height": float,
         "hexsidelength": float,
         "id": int,
+        "infinite": convert_to_bool,
         "italic": convert_to_bool,
         "kerning": convert_to_bool,
         "margin": int,
@@ -365,6 +409,262 @@ def parse_properties(node: ElementTree.Element, customs: dict = None) -> Dict:
     return d
 
 
+# tiled json (.tmj, .tsj) support.  json documents are converted to the
+# same element tree a .tmx or .tsx file would give, so that the rest of
+# pytmx reads both formats with the same code.
+
+# tiled json layer types, and the tmx tags they stand for
+json_layer_tags = {
+    "tilelayer": "layer",
+    "objectgroup": "objectgroup",
+    "imagelayer": "imagelayer",
+    "group": "group",
+}
+
+# values tiled always writes to json, but leaves out of tmx files
+json_defaults = {
+    "class": "",
+    "compressionlevel": -1,
+    "draworder": "topdown",
+    "locked": False,
+    "name": "",
+    "offsetx": 0,
+    "offsety": 0,
+    "opacity": 1,
+    "parallaxx": 1,
+    "parallaxy": 1,
+    "repeatx": False,
+    "repeaty": False,
+    "rotation": 0,
+    "type": "",
+    "visible": True,
+}
+
+
+class JsonData(ElementTree.Element):
+    """<data> or <chunk> element made from json, with its gids already decoded."""
+
+    gids = None
+
+
+def _json_attributes(data: dict, skip: Sequence[str] = ()) -> Dict[str, str]:
+    """Return the values of a json object as tmx attribute strings."""
+    attributes = dict()
+    for key, value in data.items():
+        if key in skip or isinstance(value, (list, dict)):
+            continue
+        if key in json_defaults:
+            default = json_defaults[key]
+            if value == default and isinstance(value, bool) == isinstance(
+                default, bool
+            ):
+                continue
+        if isinstance(value, bool):
+            value = int(value)
+        attributes[key] = str(value)
+    return attributes
+
+
+def _json_properties(parent: ElementTree.Element, properties) -> None:
+    if not properties:
+        return
+    # tiled older than 1.2 wrote properties as a plain dictionary
+    if isinstance(properties, dict):
+        properties = [{"name": k, "value": v} for k, v in properties.items()]
+    node = ElementTree.SubElement(parent, "properties")
+    for prop in properties:
+        attributes = {"name": prop["name"]}
+        prop_type = prop.get("type", "string")
+        if prop_type != "string":
+            attributes["type"] = prop_type
+        if prop.get("propertytype"):
+            attributes["propertytype"] = prop["propertytype"]
+        value = prop.get("value", "")
+        if isinstance(value, dict):
+            subnode = ElementTree.SubElement(node, "property", attributes)
+            _json_properties(
+                subnode, [{"name": k, "value": v} for k, v in value.items()]
+            )
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        attributes["value"] = str(value)
+        ElementTree.SubElement(node, "property", attributes)
+
+
+def _json_image(parent, source, width=None, height=None, trans=None) -> None:
+    attributes = {"source": source}
+    if trans:
+        attributes["trans"] = trans.lstrip("#")
+    if width is not None:
+        attributes["width"] = str(width)
+    if height is not None:
+        attributes["height"] = str(height)
+    ElementTree.SubElement(parent, "image", attributes)
+
+
+def _json_data(parent, tag: str, data, attributes: Dict[str, str]) -> None:
+    node = JsonData(tag, attributes)
+    if isinstance(data, str):
+        node.text = data
+    else:
+        node.gids = data
+    parent.append(node)
+
+
+def _json_object(parent: ElementTree.Element, data: dict) -> None:
+    node = ElementTree.SubElement(
+        parent,
+        "object",
+        _json_attributes(data, ("ellipse", "point", "text")),
+    )
+    _json_properties(node, data.get("properties"))
+    for shape in ("polygon", "polyline"):
+        if shape in data:
+            points = " ".join(f"{p['x']},{p['y']}" for p in data[shape])
+            ElementTree.SubElement(node, shape, {"points": points})
+    for shape in ("ellipse", "point"):
+        if data.get(shape):
+            ElementTree.SubElement(node, shape)
+
+
+def _json_layer(parent: ElementTree.Element, data: dict) -> None:
+    kind = data["type"]
+    try:
+        tag = json_layer_tags[kind]
+    except KeyError:
+        raise ValueError(f"unknown layer type {kind}")
+
+    # tiled writes x and y as 0 for every layer, tmx layers have no position
+    skip = ["type", "x", "y", "data", "encoding", "compression", "startx", "starty"]
+    if tag == "imagelayer":
+        skip.extend(("image", "imagewidth", "imageheight", "transparentcolor"))
+    node = ElementTree.SubElement(parent, tag, _json_attributes(data, skip))
+    _json_properties(node, data.get("properties"))
+
+    if tag == "layer":
+        encoding = {"encoding": data.get("encoding", "csv")}
+        if data.get("compression"):
+            encoding["compression"] = data["compression"]
+        if "chunks" in data:
+            data_node = ElementTree.SubElement(node, "data", encoding)
+            for chunk in data["chunks"]:
+                attributes = _json_attributes(chunk, ("data",))
+                _json_data(data_node, "chunk", chunk["data"], attributes)
+        else:
+            _json_data(node, "data", data["data"], encoding)
+    elif tag == "objectgroup":
+        for obj in data.get("objects", ()):
+            _json_object(node, obj)
+    elif tag == "imagelayer":
+        if data.get("image"):
+            _json_image(
+                node,
+                data["image"],
+                data.get("imagewidth"),
+                data.get("imageheight"),
+                data.get("transparentcolor"),
+            )
+    elif tag == "group":
+        for layer in data.get("layers", ()):
+            _json_layer(node, layer)
+
+
+def _json_tileset(parent: Optional[ElementTree.Element], data: dict):
+    skip = (
+        "type",
+        "image",
+        "imagewidth",
+        "imageheight",
+        "transparentcolor",
+    )
+    if parent is None:
+        node = ElementTree.Element("tileset", _json_attributes(data, skip))
+    else:
+        node = ElementTree.SubElement(parent, "tileset", _json_attributes(data, skip))
+    _json_properties(node, data.get("properties"))
+
+    offset = data.get("tileoffset")
+    if offset:
+        ElementTree.SubElement(node, "tileoffset", _json_attributes(offset))
+    if data.get("image"):
+        _json_image(
+            node,
+            data["image"],
+            data.get("imagewidth"),
+            data.get("imageheight"),
+            data.get("transparentcolor"),
+        )
+
+    for tile in data.get("tiles", ()):
+        tile_node = ElementTree.SubElement(
+            node,
+            "tile",
+            _json_attributes(tile, ("image", "imagewidth", "imageheight")),
+        )
+        _json_properties(tile_node, tile.get("properties"))
+        if tile.get("image"):
+            _json_image(
+                tile_node,
+                tile["image"],
+                tile.get("imagewidth"),
+                tile.get("imageheight"),
+            )
+        if tile.get("objectgroup"):
+            _json_layer(tile_node, tile["objectgroup"])
+        if tile.get("animation"):
+            animation = ElementTree.SubElement(tile_node, "animation")
+            for frame in tile["animation"]:
+                ElementTree.SubElement(animation, "frame", _json_attributes(frame))
+    return node
+
+
+def json_to_element(data: dict) -> ElementTree.Element:
+    """Convert a tiled json map or tileset to the element tree of its tmx/tsx twin.
+
+    Args:
+        data (dict): Parsed .tmj or .tsj file.
+
+    Returns:
+        ElementTree.Element: <map> or <tileset> element.
+
+    Raises:
+        ValueError: if the json is not a map or tileset.
+
+    """
+    kind = data.get("type", "map")
+    if kind == "tileset":
+        return _json_tileset(None, data)
+    if kind != "map":
+        raise ValueError(f"json of type {kind} is not a map or tileset")
+
+    node = ElementTree.Element(
+        "map", _json_attributes(data, ("type", "layers", "tilesets"))
+    )
+    _json_properties(node, data.get("properties"))
+    for tileset in data.get("tilesets", ()):
+        _json_tileset(node, tileset)
+    for layer in data.get("layers", ()):
+        _json_layer(node, layer)
+    return node
+
+
+def parse_file(path: str) -> ElementTree.Element:
+    """Return the root element of a tiled map or tileset, in xml or json.
+
+    Args:
+        path (str): Path of a .tmx, .tsx, .tmj, .tsj or .json file.
+
+    Returns:
+        ElementTree.Element: The root node.
+
+    """
+    if os.path.splitext(path)[1].lower() in JSON_EXTENSIONS:
+        with open(path, "rb") as file:
+            return json_to_element(json.load(file))
+    return ElementTree.parse(path).getroot()
+
+
 class TiledElement:
     """Base class for all pytmx types."""
 
@@ -436,10 +736,13 @@ class TiledElement:
         self.properties = properties
 
     def __getattr__(self, item):
+        # look in __dict__ directly, so that half built objects (pickle, copy)
+        # do not recurse forever looking for self.properties
+        properties = self.__dict__.get("properties", {})
         try:
-            return self.properties[item]
+            return properties[item]
         except KeyError:
-            if self.properties.get("name", None):
+            if properties.get("name", None):
                 raise AttributeError(
                     "Element '{0}' has no property {1}".format(self.name, item)
                 )
@@ -469,6 +772,171 @@ class TiledClassType:
             setattr(self, member["name"], member["value"])
 
 
+class TileImages(Sequence):
+    """List of tile images that are only loaded the first time they are used.
+
+    Most maps only use a handful of the tiles in each of their tilesets, so
+    instead of running the image loader for every tile up front, the loader
+    is stored and only called when the gid is looked up.
+
+    """
+
+    def __init__(self, size: int = 0) -> None:
+        self._images = [None] * size
+        self._pending = dict()  # gid: (loader, rect, flags)
+        self.materialized = 0  # number of tile images actually loaded
+
+    def defer(self, gid: int, loader, rect=None, flags=None) -> None:
+        """Set the image for a gid to be loaded by `loader` when first used.
+
+        Args:
+            gid (int): GID of the image.
+            loader: Image loader function returned by the map's image loader.
+            rect: Area of the tileset image, passed to the loader.
+            flags: TileFlags, passed to the loader.
+
+        """
+        self._images[gid] = None
+        self._pending[gid] = (loader, rect, flags)
+
+    @property
+    def deferred(self) -> int:
+        """Number of tile images that have not been loaded yet."""
+        return len(self._pending)
+
+    def __getitem__(self, gid):
+        if isinstance(gid, slice):
+            return [self[i] for i in range(*gid.indices(len(self)))]
+        image = self._images[gid]
+        if image is None and self._pending:
+            if gid < 0:
+                gid += len(self._images)
+            try:
+                loader, rect, flags = self._pending.pop(gid)
+            except KeyError:
+                return None
+            image = self._images[gid] = loader(rect, flags)
+            self.materialized += 1
+        return image
+
+    def __setitem__(self, gid: int, image) -> None:
+        self._pending.pop(gid, None)
+        self._images[gid] = image
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def append(self, image) -> None:
+        self._images.append(image)
+
+    def __repr__(self):
+        return "<{}: {} loaded, {} deferred>".format(
+            self.__class__.__name__, self.materialized, self.deferred
+        )
+
+
+class TilesetRegistry:
+    """Process wide cache of parsed external (.tsx or .tsj) tilesets.
+
+    Maps that share a tileset (every map in a world, usually) only parse
+    its file, and the properties of its tiles, once.  Entries are keyed by
+    absolute path, are parsed again if
+    the file changes, and the least recently used ones are dropped once
+    there are more than `max_size` of them.  Maps can be parsed on several
+    threads at once, so access is locked.
+
+    """
+
+    def __init__(self, max_size: int = 32) -> None:
+        self.max_size = max_size
+        # path: [mtime, root node, parsed tiles or None until asked for]
+        self._tilesets = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> ElementTree.Element:
+        """Return the root node of a .tsx or .tsj file, parsing it if needed.
+
+        Args:
+            path (str): Absolute path of the .tsx or .tsj file.
+
+        Returns:
+            ElementTree.Element: The parsed tileset node.  Do not modify it.
+
+        Raises:
+            IOError: if the file cannot be read.
+
+        """
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            try:
+                cached_mtime, node, _ = self._tilesets[path]
+            except KeyError:
+                pass
+            else:
+                if cached_mtime == mtime:
+                    self._tilesets.move_to_end(path)
+                    self.hits += 1
+                    return node
+
+            self.misses += 1
+            node = parse_file(path)
+            self._tilesets[path] = [mtime, node, None]
+            self._tilesets.move_to_end(path)
+            while len(self._tilesets) > self.max_size:
+                self._tilesets.popitem(last=False)
+            return node
+
+    def get_tiles(self, path: str, node: ElementTree.Element) -> list:
+        """Return the parsed tiles of a tileset got from `get`.
+
+        Args:
+            path (str): Absolute path of the .tsx or .tsj file.
+            node (ElementTree.Element): Its node, as returned by `get`.
+
+        Returns:
+            list: As returned by parse_tiles.  Do not modify it.
+
+        """
+        with self._lock:
+            entry = self._tilesets.get(path)
+            if entry is None or entry[1] is not node:
+                # changed or dropped since, so not worth keeping
+                return parse_tiles(node)
+            if entry[2] is None:
+                entry[2] = parse_tiles(node)
+            return entry[2]
+
+    def clear(self) -> None:
+        """Forget every cached tileset."""
+        with self._lock:
+            self._tilesets.clear()
+
+
+tileset_registry = TilesetRegistry()
+
+
+def parse_tiles(node: ElementTree.Element) -> list:
+    """Parse the <tile> nodes of a tileset, as far as maps can share them.
+
+    Args:
+        node (ElementTree.Element): The tileset node.
+
+    Returns:
+        list: (local id, properties, image node or None, tile node) of
+        every tile.  Paths are as written in the tileset, and gids are not
+        set, as both depend on the map.
+
+    """
+    tiles = list()
+    for child in node.iter("tile"):
+        p = {k: types[k](v) for k, v in child.items()}
+        p.update(parse_properties(child))
+        tiles.append((int(child.get("id")), p, child.find("image"), child))
+    return tiles
+
+
 class TiledMap(TiledElement):
     """Contains the layers, objects, and images from a Tiled .tmx map."""
 
@@ -479,7 +947,7 @@ class TiledMap(TiledElement):
         image_loader=default_image_loader,
         **kwargs,
     ) -> None:
-        """Load new Tiled map from a .tmx file.
+        """Load new Tiled map from a .tmx or .tmj file.
 
         Args:
             filename (Optional[str]): Filename of tiled map to load.
@@ -518,14 +986,23 @@ class TiledMap(TiledElement):
         self.tiledgidmap = dict()  # mapping of tiledgid to pytmx gid
         self.maxgid = 1
 
+        # indexes kept up to date by add_layer and add_tileset
+        self.firstgids = list()  # sorted firstgid of every tileset
+        self.tilesets_by_firstgid = dict()  # firstgid: TiledTileset
+        self.tile_locations = defaultdict(list)  # gid: [(x, y, layer index)]
+        # tile layers not in tile_locations yet.  it is big, so is only
+        # built the first time it is needed
+        self.unindexed_layers = list()
+
         # should be filled in by a loader function
-        self.images = list()
+        self.images = TileImages()
 
         # defaults from the TMX specification
         self.version = "0.0"
         self.tiledversion = ""
         self.orientation = "orthogonal"
         self.renderorder = "right-down"
+        self.infinite = False  # if true, tile layers are stored in chunks
         self.width = 0  # width of map in tiles
         self.height = 0  # height of map in tiles
         self.tilewidth = 0  # width of a tile in pixels
@@ -545,7 +1022,10 @@ class TiledMap(TiledElement):
             self.parse_json(json.load(open(custom_property_filename)))
 
         if filename:
-            self.parse_xml(ElementTree.parse(self.filename).getroot())
+            if os.path.splitext(filename)[1].lower() in JSON_EXTENSIONS:
+                self.parse_xml(parse_file(filename))
+            else:
+                self.parse_stream(filename)
 
     def __repr__(self):
         return '<{0}: "{1}">'.format(self.__class__.__name__, self.filename)
@@ -585,27 +1065,86 @@ class TiledMap(TiledElement):
         """
         self._set_properties(node)
         self.background_color = node.get("backgroundcolor", self.background_color)
+        self._parse_nodes(
+            node.findall(".//group"),
+            [TiledTileLayer(self, subnode) for subnode in node.findall(".//layer")],
+            node.findall(".//imagelayer"),
+            node.findall(".//objectgroup"),
+            node.findall(".//tileset"),
+        )
+        return self
 
+    def parse_stream(self, source) -> None:
+        """Parse a map from a .tmx file in one streaming pass.
+
+        Tile layers, which hold nearly all of the data, are parsed and
+        thrown away as soon as they are read, so the whole document is
+        never held in memory at once.
+
+        Args:
+            source: Filename or file object of the .tmx file.
+
+        """
+        deferred = {
+            "group": list(),
+            "imagelayer": list(),
+            "objectgroup": list(),
+            "tileset": list(),
+        }
+        tile_layers = list()
+        root = None
+        for event, element in ElementTree.iterparse(source, ("start", "end")):
+            if event == "start":
+                # collected on start, so they are in the same order as findall
+                if root is None:
+                    root = element
+                elif element.tag in deferred:
+                    deferred[element.tag].append(element)
+            elif element.tag == "layer":
+                # tile layers register their gids first, in document order
+                tile_layers.append(TiledTileLayer(self, element))
+                element.clear()
+
+        self._set_properties(root)
+        self.background_color = root.get("backgroundcolor", self.background_color)
+        self._parse_nodes(
+            deferred["group"],
+            tile_layers,
+            deferred["imagelayer"],
+            deferred["objectgroup"],
+            deferred["tileset"],
+        )
+        return self
+
+    def _parse_nodes(
+        self,
+        groups: List[ElementTree.Element],
+        tile_layers: List[TiledTileLayer],
+        imagelayers: List[ElementTree.Element],
+        objectgroups: List[ElementTree.Element],
+        tilesets: List[ElementTree.Element],
+    ) -> None:
+        """Add everything in the map, once its tile layers are parsed."""
         # ***         do not change this load order!         *** #
         # ***    gid mapping errors will occur if changed    *** #
-        for subnode in node.findall(".//group"):
+        for subnode in groups:
             self.add_layer(TiledGroupLayer(self, subnode))
 
-        for subnode in node.findall(".//layer"):
-            self.add_layer(TiledTileLayer(self, subnode))
+        for layer in tile_layers:
+            self.add_layer(layer)
 
-        for subnode in node.findall(".//imagelayer"):
+        for subnode in imagelayers:
             self.add_layer(TiledImageLayer(self, subnode))
 
         # this will only find objectgroup layers, not including tile colliders
-        for subnode in node.findall(".//objectgroup"):
+        for subnode in objectgroups:
             objectgroup = TiledObjectGroup(self, subnode, self.custom_types)
             self.add_layer(objectgroup)
             for obj in objectgroup:
                 self.objects_by_id[obj.id] = obj
                 self.objects_by_name[obj.name] = obj
 
-        for subnode in node.findall(".//tileset"):
+        for subnode in tilesets:
             self.add_tileset(TiledTileset(self, subnode))
 
         # "tile objects", objects with a GID, require their attributes to be
@@ -629,7 +1168,6 @@ class TiledMap(TiledElement):
                 o.y -= o.height
 
         self.reload_images()
-        return self
 
     def reload_images(self) -> None:
         """Load or reload the map images from disk.
@@ -639,18 +1177,28 @@ class TiledMap(TiledElement):
         images will be loaded.
 
         """
-        self.images = [None] * self.maxgid
+        self.load_images(self.build_tile_atlas())
+
+    def build_tile_atlas(
+        self,
+    ) -> List[Tuple[int, int, Tuple[int, int, int, int], TileFlags]]:
+        """Find where every tile image lives in its tileset image.
+
+        Tiles that are not used by the map are registered here if
+        `load_all_tiles` is set or they are in `optional_gids`.
+
+        Returns:
+            List[Tuple[int, int, Tuple[int, int, int, int], TileFlags]]: (gid, tileset index, rect, flags) tuples.
+
+        """
+        atlas = list()
 
         # iterate through tilesets to get source images
-        for ts in self.tilesets:
+        for ts_index, ts in enumerate(self.tilesets):
             # skip tilesets without a source
             if ts.source is None:
                 continue
 
-            path = os.path.join(os.path.dirname(self.filename), ts.source)
-            colorkey = getattr(ts, "trans", None)
-            loader = self.image_loader(path, colorkey, tileset=ts)
-
             p = product(
                 range(
                     ts.margin,
@@ -677,28 +1225,51 @@ class TiledMap(TiledElement):
                         gids = [self.register_gid(real_gid, flags=0)]
 
                 if gids:
-                    # flags might rotate/flip the image, so let the loader
-                    # handle that here
                     for gid, flags in gids:
-                        self.images[gid] = loader(rect, flags)
-                # else:
-                #     # not used in layer data give another chance to load the tile anyway
-                #     if self.load_all_tiles or real_gid in self.optional_gids:
-                #         # TODO: handle flags? - might never be an issue, though
-                #         self.register_gid(real_gid, flags=0)
+                        atlas.append((gid, ts_index, rect, flags))
+
+        return atlas
+
+    def load_images(
+        self, atlas: Iterable[Tuple[int, int, Tuple[int, int, int, int], TileFlags]]
+    ) -> None:
+        """Load the map images described by a tile atlas.
+
+        Args:
+            atlas: (gid, tileset index, rect, flags) tuples, see `build_tile_atlas`.
+
+        """
+        self.images = TileImages(self.maxgid)
+
+        loaders = dict()
+        for gid, ts_index, rect, flags in atlas:
+            try:
+                loader = loaders[ts_index]
+            except KeyError:
+                ts = self.tilesets[ts_index]
+                path = os.path.join(os.path.dirname(self.filename), ts.source)
+                colorkey = getattr(ts, "trans", None)
+                loader = loaders[ts_index] = self.image_loader(
+                    path, colorkey, tileset=ts
+                )
+            # flags might rotate/flip the image, so let the loader
+            # handle that here, once the tile is actually used
+            self.images.defer(gid, loader, rect, flags)
 
         # load image layer images
         for layer in (i for i in self.layers if isinstance(i, TiledImageLayer)):
             source = getattr(layer, "source", None)
             if source:
                 colorkey = getattr(layer, "trans", None)
-                real_gid = len(self.images)
-                gid = self.register_gid(real_gid)
-                layer.gid = gid
                 path = os.path.join(os.path.dirname(self.filename), source)
                 loader = self.image_loader(path, colorkey)
                 image = loader()
-                self.images.append(image)
+                # the gid is kept when images are reloaded
+                if layer.gid:
+                    self.images[layer.gid] = image
+                else:
+                    layer.gid = self.register_gid(len(self.images))
+                    self.images.append(image)
 
         # load images in tiles.
         # instead of making a new gid, replace the reference to the tile that
@@ -709,8 +1280,7 @@ class TiledMap(TiledElement):
                 colorkey = props.get("trans", None)
                 path = os.path.join(os.path.dirname(self.filename), source)
                 loader = self.image_loader(path, colorkey)
-                image = loader()
-                self.images[real_gid] = image
+                self.images.defer(real_gid, loader)
 
     def get_tile_image(self, x: int, y: int, layer: int):
         """Return the tile image for this location.
@@ -741,7 +1311,7 @@ class TiledMap(TiledElement):
         assert isinstance(layer, TiledTileLayer)
 
         try:
-            gid = layer.data[y][x]
+            gid = layer.get_gid(x, y)
         except (IndexError, ValueError):
             raise ValueError("GID not found")
         except TypeError:
@@ -801,7 +1371,7 @@ class TiledMap(TiledElement):
             )
 
         try:
-            return self.layers[int(layer)].data[int(y)][int(x)]
+            return self.layers[int(layer)].get_gid(int(x), int(y))
         except (IndexError, ValueError):
             msg = "Coords: ({0},{1}) in layer {2} is invalid"
             logger.debug(msg.format(x, y, layer))
@@ -830,7 +1400,7 @@ class TiledMap(TiledElement):
             )
 
         try:
-            gid = self.layers[int(layer)].data[int(y)][int(x)]
+            gid = self.layers[int(layer)].get_gid(int(x), int(y))
         except (IndexError, ValueError):
             msg = "Coords: ({0},{1}) in layer {2} is invalid."
             logger.debug(msg.format(x, y, layer))
@@ -849,7 +1419,8 @@ class TiledMap(TiledElement):
     def get_tile_locations_by_gid(self, gid: int) -> Iterable[MapPoint]:
         """Search map for tile locations by the GID.
 
-        Note: Not a fast operation.  Cache results if used often.
+        Uses an index of the layers added by `add_layer`, built on the
+        first search, so changes made to layer data afterwards are not seen.
 
         Args:
             gid (int): GID to be searched for.
@@ -858,8 +1429,16 @@ class TiledMap(TiledElement):
             Iterable[MapPoint]: (int, int, int) tuples, where the layer is index of the visible tile layers.
 
         """
-        for l in self.visible_tile_layers:
-            for x, y, _gid in [i for i in self.layers[l].iter_data() if i[2] == gid]:
+        locations = self.tile_locations
+        for index in self.unindexed_layers:
+            for x, y, layer_gid in self.layers[index].iter_data():
+                if layer_gid:
+                    locations[layer_gid].append((x, y, index))
+        self.unindexed_layers.clear()
+
+        layers = self.layers
+        for x, y, l in locations.get(gid, ()):
+            if layers[l].visible:
                 yield x, y, l
 
     def get_tile_properties_by_gid(self, gid: int) -> Optional[Dict]:
@@ -905,10 +1484,7 @@ class TiledMap(TiledElement):
             logger.debug(msg.format(type(layer)))
             raise ValueError
 
-        p = product(range(self.width), range(self.height))
-        layergids = set(self.layers[layer].data[y][x] for x, y in p)
-
-        for gid in layergids:
+        for gid in self.layers[layer].used_gids:
             try:
                 yield gid, self.tile_properties[gid]
             except KeyError:
@@ -930,6 +1506,9 @@ class TiledMap(TiledElement):
             layer, (TiledGroupLayer, TiledTileLayer, TiledImageLayer, TiledObjectGroup)
         )
 
+        if isinstance(layer, TiledTileLayer):
+            self.unindexed_layers.append(len(self.layers))
+
         self.layers.append(layer)
         self.layernames[layer.name] = layer
 
@@ -937,6 +1516,9 @@ class TiledMap(TiledElement):
         """Add a tileset to the map."""
         assert isinstance(tileset, TiledTileset)
         self.tilesets.append(tileset)
+        if tileset.firstgid not in self.tilesets_by_firstgid:
+            insort(self.firstgids, tileset.firstgid)
+            self.tilesets_by_firstgid[tileset.firstgid] = tileset
 
     def get_layer_by_name(self, name: str) -> int:
         """Return a layer by name.
@@ -985,9 +1567,6 @@ class TiledMap(TiledElement):
     def get_tileset_from_gid(self, gid: int) -> TiledTileset:
         """Return tileset that owns the gid.
 
-        Note: this is a slow operation, so if you are expecting to do this
-              often, it would be worthwhile to cache the results of this.
-
         Args:
             gid (int): GID of tile image.
 
@@ -1003,11 +1582,10 @@ class TiledMap(TiledElement):
         except KeyError:
             raise ValueError("Tile GID not found")
 
-        for tileset in sorted(self.tilesets, key=attrgetter("firstgid"), reverse=True):
-            if tiled_gid >= tileset.firstgid:
-                return tileset
-
-        raise ValueError("Tileset not found")
+        i = bisect_right(self.firstgids, tiled_gid)
+        if not i:
+            raise ValueError("Tileset not found")
+        return self.tilesets_by_firstgid[self.firstgids[i - 1]]
 
     def get_tile_colliders(self) -> Iterable[Tuple[int, List[Dict]]]:
         """Return iterator of (gid, dict) pairs of tiles with colliders.
@@ -1163,6 +1741,9 @@ class TiledTileset(TiledElement):
         self.parent = parent
         self.offset = (0, 0)
 
+        # path of the external .tsx or .tsj file, if any
+        self.filename = None
+
         # defaults from the specification
         self.firstgid = 0
         self.source = None
@@ -1197,7 +1778,7 @@ class TiledTileset(TiledElement):
         # if true, then node references an external tileset
         source = node.get("source", None)
         if source:
-            if source[-4:].lower() == ".tsx":
+            if os.path.splitext(source)[1].lower() in (".tsx",) + JSON_EXTENSIONS:
                 # external tilesets don't save this, store it for later
                 self.firstgid = int(node.get("firstgid"))
 
@@ -1212,8 +1793,10 @@ class TiledTileset(TiledElement):
                         )
                     )
 
+                self.filename = path
                 try:
-                    node = ElementTree.parse(path).getroot()
+                    node = tileset_registry.get(path)
+                    tiles = tileset_registry.get_tiles(path, node)
                 except IOError as io:
                     msg = "Error loading external tileset: {0}"
                     logger.error(msg.format(path))
@@ -1222,24 +1805,23 @@ class TiledTileset(TiledElement):
                 msg = "Found external tileset, but cannot handle type: {0}"
                 logger.error(msg.format(self.source))
                 raise Exception(msg.format(self.source))
+        else:
+            tiles = parse_tiles(node)
 
         self._set_properties(node)
 
         # since tile objects [probably] don't have a lot of metadata,
         # we store it separately in the parent (a TiledMap instance)
         register_gid = self.parent.register_gid
-        for child in node.iter("tile"):
-            tiled_gid = int(child.get("id"))
-
-            p = {k: types[k](v) for k, v in child.items()}
-            p.update(parse_properties(child))
+        for tiled_gid, properties, image, child in tiles:
+            # copied, the parsed tiles are shared between maps
+            p = dict(properties)
 
             # images are listed as relative to the .tsx file, not the .tmx file:
             if source and "path" in p:
                 p["path"] = os.path.join(os.path.dirname(source), p["path"])
 
             # handle tiles that have their own image
-            image = child.find("image")
             if image is None:
                 p["width"] = self.tilewidth
                 p["height"] = self.tileheight
@@ -1333,7 +1915,13 @@ class TiledTileLayer(TiledElement):
     def __init__(self, parent, node) -> None:
         TiledElement.__init__(self)
         self.parent = parent
-        self.data = list()
+        self.gids = array(GID_TYPECODE)  # flat, row major
+        self.data = list()  # rows of self.gids, indexed as data[y][x]
+        self.used_gids = set()  # every gid in the layer, except 0
+
+        # infinite maps store their layers in chunks instead of data
+        self.chunks = dict()  # (x, y) of chunk in tiles: TileChunk
+        self.chunk_size = None  # (width, height) of every chunk in tiles
 
         # defaults from the specification
         self.name = None
@@ -1359,6 +1947,79 @@ class TiledTileLayer(TiledElement):
         for y, row in enumerate(self.data):
             for x, gid in enumerate(row):
                 yield x, y, gid
+        for chunk in self.chunks.values():
+            for y, row in enumerate(chunk.data, chunk.y):
+                for x, gid in enumerate(row, chunk.x):
+                    yield x, y, gid
+
+    def get_gid(self, x: int, y: int) -> int:
+        """Return the gid at a position in the layer, chunked or not.
+
+        Empty areas of an infinite layer are gid 0.
+
+        Args:
+            x (int): The x coordinate, in tiles.
+            y (int): The y coordinate, in tiles.
+
+        Returns:
+            int: The gid.
+
+        Raises:
+            IndexError: If the coordinates are outside a finite layer.
+
+        """
+        if not self.chunks:
+            return self.data[y][x]
+        width, height = self.chunk_size
+        chunk = self.chunks.get((x - x % width, y - y % height), None)
+        if chunk is None:
+            return 0
+        return chunk.data[y - chunk.y][x - chunk.x]
+
+    def iter_chunks(
+        self, x: int, y: int, width: int, height: int
+    ) -> Iterable[TileChunk]:
+        """Yields the chunks that overlap an area of the layer.
+
+        Only looks up the chunks in the area, so it doesn't matter how big the layer is.
+
+        Args:
+            x (int): Left of the area, in tiles.
+            y (int): Top of the area, in tiles.
+            width (int): Width of the area, in tiles.
+            height (int): Height of the area, in tiles.
+
+        Returns:
+            Iterable[TileChunk]: The chunks in the area.
+
+        """
+        if not self.chunks:
+            return
+        chunk_width, chunk_height = self.chunk_size
+        left = x - x % chunk_width
+        top = y - y % chunk_height
+        for chunk_y in range(top, y + height, chunk_height):
+            for chunk_x in range(left, x + width, chunk_width):
+                chunk = self.chunks.get((chunk_x, chunk_y), None)
+                if chunk is not None:
+                    yield chunk
+
+    def get_chunk_bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """Return the area covered by the layer's chunks.
+
+        Returns:
+            Optional[Tuple[int, int, int, int]]: (left, top, right, bottom) in tiles, or None if the layer isn't chunked.
+
+        """
+        if not self.chunks:
+            return None
+        chunks = self.chunks.values()
+        return (
+            min(chunk.x for chunk in chunks),
+            min(chunk.y for chunk in chunks),
+            max(chunk.x + chunk.width for chunk in chunks),
+            max(chunk.y + chunk.height for chunk in chunks),
+        )
 
     def tiles(self):
         """Yields X, Y, Image tuples for each tile in the layer.
@@ -1392,38 +2053,49 @@ class TiledTileLayer(TiledElement):
         """
         self._set_properties(node)
         data_node = node.find("data")
-        chunk_nodes = data_node.findall("chunk")
-        if chunk_nodes:
-            msg = "TMX map size: infinite is not supported."
-            logger.error(msg)
-            raise Exception
+        encoding = data_node.get("encoding", None)
+        compression = data_node.get("compression", None)
 
-        child = data_node.find("tile")
+        child = data_node.find(".//tile")
         if child is not None:
             raise ValueError(
                 "XML tile elements are no longer supported. Must use base64 or csv map formats."
             )
 
+        # infinite maps store the layer in chunks
+        for chunk_node in data_node.iterfind("chunk"):
+            x, y = int(chunk_node.get("x")), int(chunk_node.get("y"))
+            width = int(chunk_node.get("width"))
+            height = int(chunk_node.get("height"))
+            gids = self._remap_gids(read_gids(chunk_node, encoding, compression))
+            self.chunks[x, y] = TileChunk(
+                x, y, width, height, gids, reshape_data(gids, width)
+            )
+            self.chunk_size = (width, height)
+        if self.chunks:
+            return self
+
+        self.gids = self._remap_gids(read_gids(data_node, encoding, compression))
+        self.data = reshape_data(self.gids, self.width)
+        return self
+
+    def _remap_gids(self, gids: array) -> array:
+        """Register tiled gids with the map, and return them as pytmx gids."""
+        # register every distinct gid once, in order of first appearance,
+        # then remap the whole layer through the lookup table in one pass
         reg = self.parent.register_gid
-        temp = list()
-        temp_append = temp.append
-        for gid in unpack_gids(
-            text=data_node.text.strip(),
-            encoding=data_node.get("encoding", None),
-            compression=data_node.get("compression", None),
-        ):
-            if gid == 0:
-                temp_append(0)
+        lut = {0: 0}
+        for gid in dict.fromkeys(gids):
+            if gid in lut:
+                continue
             elif gid < GID_TRANS_ROT:
-                gid = reg(gid)
-                temp_append(gid)
+                lut[gid] = reg(gid)
             else:
-                gid, flags = decode_gid(gid)
-                gid = reg(gid, flags)
-                temp_append(gid)
+                lut[gid] = reg(*decode_gid(gid))
 
-        self.data = reshape_data(temp, self.width)
-        return self
+        self.used_gids.update(lut.values())
+        self.used_gids.discard(0)
+        return array(GID_TYPECODE, map(lut.__getitem__, gids))
 
 
 class TiledObjectGroup(TiledElement, list):
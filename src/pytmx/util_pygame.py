@@ -19,6 +19,8 @@ License along with pytmx.  If not, see <http://www.gnu.org/licenses/>.
 """
 import itertools
 import logging
+import os
+from collections import OrderedDict
 from typing import List, Optional, Union
 
 import pytmx
@@ -33,7 +35,27 @@ except ImportError:
     logger.error("cannot import pygame (is it installed?)")
     raise
 
-__all__ = ["load_pygame", "pygame_image_loader", "simplify", "build_rects"]
+__all__ = [
+    "load_pygame",
+    "pygame_image_loader",
+    "simplify",
+    "merge_rects",
+    "build_rects",
+    "tileset_cache",
+]
+
+# (rotation, flip x, flip y) for each (diagonal, horizontal, vertical) flip
+# combination, so that no tile needs more than one rotate and one flip
+TRANSFORMS = {
+    (False, False, False): (0, False, False),
+    (False, False, True): (0, False, True),
+    (False, True, False): (0, True, False),
+    (False, True, True): (0, True, True),
+    (True, False, False): (270, True, False),
+    (True, False, True): (90, False, False),
+    (True, True, False): (270, False, False),
+    (True, True, True): (90, True, False),
+}
 
 
 def handle_transformation(
@@ -51,10 +73,15 @@ def handle_transformation(
         new tile surface
 
     """
-    if flags.flipped_diagonally:
-        tile = flip(rotate(tile, 270), True, False)
-    if flags.flipped_horizontally or flags.flipped_vertically:
-        tile = flip(tile, flags.flipped_horizontally, flags.flipped_vertically)
+    angle, flip_x, flip_y = TRANSFORMS[
+        bool(flags.flipped_diagonally),
+        bool(flags.flipped_horizontally),
+        bool(flags.flipped_vertically),
+    ]
+    if angle:
+        tile = rotate(tile, angle)
+    if flip_x or flip_y:
+        tile = flip(tile, flip_x, flip_y)
     return tile
 
 
@@ -84,6 +111,10 @@ def smart_convert(
         tile.set_colorkey(colorkey, pygame.RLEACCEL)
         # TODO: if there is a colorkey, count the colorkey pixels to determine if RLEACCEL should be used
 
+    # no per-pixel alpha at all, so nothing can be transparent
+    elif not original.get_flags() & pygame.SRCALPHA:
+        tile = original.convert()
+
     # no colorkey, so use a mask to determine if there are transparent pixels
     else:
         tile_size = original.get_size()
@@ -112,40 +143,176 @@ def smart_convert(
     return tile
 
 
-def pygame_image_loader(filename: str, colorkey: Optional[ColorLike], **kwargs):
-    """
-    pytmx image loader for pygame
+class TilesetImage:
+    """A tileset image and the tile surfaces converted from it so far."""
 
-    Parameters:
-        filename: filename, including path, to load
-        colorkey: colorkey for the image
+    def __init__(
+        self, filename: str, colorkey: Optional[pygame.Color], pixelalpha: bool
+    ) -> None:
+        self.filename = filename
+        self.colorkey = colorkey
+        self.pixelalpha = pixelalpha
+        self.image = None  # not read from disk until a tile is needed
+        self.tiles = dict()  # rect: converted surface
+        self.transformed_tiles = dict()  # (rect, flags): converted surface
 
-    Returns:
-        function to load tile images
+    def subsurface(self, rect=None) -> pygame.Surface:
+        """Return the unconverted area of the tileset image.
 
-    """
-    if colorkey:
-        colorkey = pygame.Color("#{0}".format(colorkey))
+        Parameters:
+            rect: area of the image, or None for all of it
 
-    pixelalpha = kwargs.get("pixelalpha", True)
-    image = pygame.image.load(filename)
+        Returns:
+            tile surface
 
-    def load_image(rect=None, flags=None):
+        """
+        if self.image is None:
+            self.image = pygame.image.load(self.filename)
         if rect:
             try:
-                tile = image.subsurface(rect)
+                return self.image.subsurface(rect)
             except ValueError:
                 logger.error("Tile bounds outside bounds of tileset image")
                 raise
+        return self.image.copy()
+
+    def get_tile(self, rect=None) -> pygame.Surface:
+        """Return the converted tile at `rect`, converting it only once.
+
+        Parameters:
+            rect: area of the image, or None for all of it
+
+        Returns:
+            tile surface, shared with every other map using this tileset
+
+        """
+        try:
+            tile = self.tiles[rect]
+        except KeyError:
+            tileset_cache.misses += 1
+            tile = self.tiles[rect] = smart_convert(
+                self.subsurface(rect), self.colorkey, self.pixelalpha
+            )
         else:
-            tile = image.copy()
+            tileset_cache.hits += 1
+        return tile
+
+    def get_transformed_tile(self, rect, flags: pytmx.TileFlags) -> pygame.Surface:
+        """Return the flipped and/or rotated tile at `rect`, converting it only once.
+
+        Parameters:
+            rect: area of the image, or None for all of it
+            flags: TileFlags object
 
-        if flags:
-            tile = handle_transformation(tile, flags)
+        Returns:
+            tile surface, shared with every other map using this tileset
 
-        tile = smart_convert(tile, colorkey, pixelalpha)
+        """
+        key = (rect, tuple(map(bool, flags)))
+        try:
+            tile = self.transformed_tiles[key]
+        except KeyError:
+            tileset_cache.transform_misses += 1
+            tile = self.transformed_tiles[key] = smart_convert(
+                handle_transformation(self.subsurface(rect), flags),
+                self.colorkey,
+                self.pixelalpha,
+            )
+        else:
+            tileset_cache.transform_hits += 1
         return tile
 
+
+class TilesetImageCache:
+    """Process wide cache of tileset images and their converted tiles.
+
+    Keyed by absolute image path (and by colorkey and pixelalpha, which
+    change how tiles are converted), so every map that uses a tileset
+    shares the same tile surfaces.  The least recently used tilesets are
+    dropped once there are more than `max_size` of them.  Maps that are
+    already loaded keep their surfaces.
+
+    """
+
+    def __init__(self, max_size: int = 32) -> None:
+        self.max_size = max_size
+        self._tilesets = OrderedDict()
+        self.hits = 0  # tiles handed out that were already converted
+        self.misses = 0  # tiles that had to be converted
+        self.transform_hits = 0  # same, for flipped or rotated tiles
+        self.transform_misses = 0
+
+    def get(
+        self, filename: str, colorkey: Optional[ColorLike], pixelalpha: bool
+    ) -> TilesetImage:
+        """Return the cached tileset image, creating it if needed.
+
+        Parameters:
+            filename: filename, including path, of the image
+            colorkey: colorkey for the image, as given by tiled
+            pixelalpha: if true, prefer per-pixel alpha surfaces
+
+        Returns:
+            TilesetImage object
+
+        """
+        key = (os.path.abspath(filename), colorkey, pixelalpha)
+        try:
+            tileset = self._tilesets[key]
+        except KeyError:
+            if colorkey:
+                colorkey = pygame.Color("#{0}".format(colorkey))
+            tileset = self._tilesets[key] = TilesetImage(filename, colorkey, pixelalpha)
+            while len(self._tilesets) > self.max_size:
+                self._tilesets.popitem(last=False)
+        else:
+            self._tilesets.move_to_end(key)
+        return tileset
+
+    def hit_rate(self, transformed: bool = False) -> float:
+        """Return the fraction of tiles handed out without converting them.
+
+        Parameters:
+            transformed: if true, count flipped or rotated tiles instead of plain ones
+
+        Returns:
+            hit rate between 0 and 1, or 0 if no tiles have been asked for
+
+        """
+        if transformed:
+            hits, misses = self.transform_hits, self.transform_misses
+        else:
+            hits, misses = self.hits, self.misses
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def clear(self) -> None:
+        """Forget every cached tileset image."""
+        self._tilesets.clear()
+
+
+tileset_cache = TilesetImageCache()
+
+
+def pygame_image_loader(filename: str, colorkey: Optional[ColorLike], **kwargs):
+    """
+    pytmx image loader for pygame
+
+    Parameters:
+        filename: filename, including path, to load
+        colorkey: colorkey for the image
+
+    Returns:
+        function to load tile images
+
+    """
+    tileset = tileset_cache.get(filename, colorkey, kwargs.get("pixelalpha", True))
+
+    def load_image(rect=None, flags=None):
+        # tiles are shared between every map using the tileset
+        if not flags or not any(flags):
+            return tileset.get_tile(rect)
+        return tileset.get_transformed_tile(rect, flags)
+
     return load_image
 
 
@@ -237,7 +404,7 @@ def build_rects(
             raise ValueError
 
     if isinstance(layer, int):
-        layer_data = tmxmap.get_layer_data(layer)
+        layer_data = tmxmap.layers[layer].data
     elif isinstance(layer, str):
         try:
             layer = [l for l in tmxmap.layers if l.name == layer].pop()
@@ -247,39 +414,31 @@ def build_rects(
             logger.debug(msg.format(layer, tmxmap))
             raise ValueError
 
-    p = itertools.product(range(tmxmap.width), range(tmxmap.height))
+    cells = itertools.chain.from_iterable(layer_data)
     if gid:
-        points = [(x, y) for (x, y) in p if layer_data[y][x] == gid]
+        grid = bytearray(i == gid for i in cells)
     else:
-        points = [(x, y) for (x, y) in p if layer_data[y][x]]
+        grid = bytearray(map(bool, cells))
 
-    rects = simplify(points, tmxmap.tilewidth, tmxmap.tileheight)
-    return rects
+    return merge_rects(grid, tmxmap.width, tmxmap.tilewidth, tmxmap.tileheight)
 
 
-def simplify(
-    all_points: List[PointLike],
+def merge_rects(
+    grid: bytearray,
+    width: int,
     tilewidth: int,
     tileheight: int,
 ) -> List[pygame.Rect]:
-    """Given a list of points, return list of rects that represent them
-    kludge:
+    """Cover the set cells of a boolean grid with non-overlapping rects.
 
-    "A kludge (or kluge) is a workaround, a quick-and-dirty solution,
-    a clumsy or inelegant, yet effective, solution to a problem, typically
-    using parts that are cobbled together."
+    Greedy meshing: each row is scanned for runs of set cells, and every
+    run is grown downwards for as long as the rows below have the same run
+    set.  Cells are cleared as they are covered, so each cell is visited a
+    constant number of times and the whole thing is O(width * height).  The
+    scanning and comparing is done with bytearray methods, so it runs at C
+    speed rather than one python step per cell.
 
-    -- wikipedia
-
-    turn a list of points into a rects
-    adjacent rects will be combined.
-
-    plain english:
-        the input list must be a list of tuples that represent
-        the areas to be combined into rects
-        the rects will be blended together over solid groups
-
-        so if data is something like:
+    so if data is something like:
 
         0 1 1 1 0 0 0
         0 1 1 0 0 0 0
@@ -288,7 +447,7 @@ def simplify(
         0 0 0 0 0 0 0
         0 0 1 1 1 1 1
 
-        you'll have the 4 rects that mask the area like this:
+    you'll have the 4 rects that mask the area like this:
 
         ..######......
         ..####........
@@ -297,56 +456,85 @@ def simplify(
         ..............
         ....##########
 
-        pretty cool, right?
+    Parameters:
+        grid: row major cells, 1 where a rect is wanted and 0 elsewhere
+        width: width of the grid in cells
+        tilewidth: width of a cell in pixels
+        tileheight: height of a cell in pixels
+
+    Returns:
+        list of pygame Rect objects
 
-    there may be cases where the number of rectangles is not as low as possible,
-    but I haven't found that it is excessively bad.  certainly much better than
-    making a list of rects, one for each tile on the map!
     """
+    grid = bytearray(grid)  # cleared as it is covered, so work on a copy
+    rects = []
+    for row_start in range(0, len(grid), width):
+        row_end = row_start + width
+        start = grid.find(1, row_start, row_end)
+        while start != -1:
+            end = grid.find(0, start, row_end)
+            if end == -1:
+                end = row_end
+            run = grid[start:end]
+            blank = bytes(end - start)
+
+            # grow the run downwards while the same cells are set below it
+            grid[start:end] = blank
+            height = 1
+            below = start + width
+            while grid[below : below + end - start] == run:
+                grid[below : below + end - start] = blank
+                height += 1
+                below += width
+
+            rects.append(
+                pygame.Rect(
+                    (start - row_start) * tilewidth,
+                    row_start // width * tileheight,
+                    (end - start) * tilewidth,
+                    height * tileheight,
+                )
+            )
+            start = grid.find(1, end, row_end)
+
+    return rects
+
+
+def simplify(
+    all_points: List[PointLike],
+    tilewidth: int,
+    tileheight: int,
+) -> List[pygame.Rect]:
+    """Given a list of points, return list of rects that represent them
 
-    def pick_rect(points, rects):
-        ox, oy = sorted([(sum(p), p) for p in points])[0][1]
-        x = ox
-        y = oy
-        ex = None
-
-        while 1:
-            x += 1
-            if not (x, y) in points:
-                if ex is None:
-                    ex = x - 1
-
-                if (ox, y + 1) in points:
-                    if x == ex + 1:
-                        y += 1
-                        x = ox
-
-                    else:
-                        y -= 1
-                        break
-                else:
-                    if x <= ex:
-                        y -= 1
-                    break
-
-        c_rect = pygame.Rect(
-            ox * tilewidth,
-            oy * tileheight,
-            (ex - ox + 1) * tilewidth,
-            (y - oy + 1) * tileheight,
-        )
-
-        rects.append(c_rect)
-
-        rect = pygame.Rect(ox, oy, ex - ox + 1, y - oy + 1)
-        kill = [p for p in points if rect.collidepoint(p)]
-        [points.remove(i) for i in kill]
-
-        if points:
-            pick_rect(points, rects)
-
-    rect_list = []
-    while all_points:
-        pick_rect(all_points, rect_list)
-
-    return rect_list
+    turn a list of points into a rects
+    adjacent rects will be combined.
+
+    the input list must be a list of tuples that represent
+    the areas to be combined into rects
+    the rects will be blended together over solid groups.
+    see `merge_rects` for how, and for an example.
+
+    Parameters:
+        all_points: (x, y) tile positions to cover
+        tilewidth: width of a tile in pixels
+        tileheight: height of a tile in pixels
+
+    Returns:
+        list of pygame Rect objects
+
+    """
+    if not all_points:
+        return []
+    left = min(int(x) for x, _ in all_points)
+    top = min(int(y) for _, y in all_points)
+    width = max(int(x) for x, _ in all_points) - left + 1
+    height = max(int(y) for _, y in all_points) - top + 1
+    grid = bytearray(width * height)
+    for x, y in all_points:
+        grid[(int(y) - top) * width + int(x) - left] = 1
+
+    rects = merge_rects(grid, width, tilewidth, tileheight)
+    for rect in rects:
+        rect.move_ip(left * tilewidth, top * tileheight)
+    return rects
@@ -0,0 +1,210 @@
+from collections import defaultdict
+from itertools import count
+
+import pygame
+
+import globals
+from bush import entity
+from bush.mapping import group
+
+# size of the cells sprites are filed in for camera culling, in pixels
+CULL_CELL_SIZE = 128
+# how far past the camera sprites are still drawn, in pixels
+CULL_MARGIN = 32
+# sprites (or the camera) that jump further than this in one step are drawn
+# where they are instead of being interpolated, in pixels
+INTERPOLATE_LIMIT = 32
+
+
+class DrawnSprite:
+    """Stands in for a sprite while it is drawn at a rect other than its own"""
+
+    def __init__(self, sprite, rect):
+        self.sprite = sprite
+        self.rect = rect
+
+    def __getattr__(self, name):
+        return getattr(self.sprite, name)
+
+    # so that group lookups by sprite still find it
+    def __eq__(self, other):
+        return self.sprite == getattr(other, "sprite", other)
+
+    def __hash__(self):
+        return hash(self.sprite)
+
+
+class CulledGroup(group.TopDownGroup):
+    """TopDownGroup that only draws the sprites near the camera.
+
+    Sprites are filed in a uniform grid of CULL_CELL_SIZE cells as they are
+    added, and drawing only looks at the cells around the area drawn (the
+    camera, or the surface when drawn at an offset).  Plain
+    entities (tiles, baked layers, scenery) never move, everything else is
+    filed again before each draw if its rect has changed.
+
+    Moving sprites and the camera are drawn between where they were before
+    and after the last update, by the engine's interpolation amount.  Their
+    own rects are left alone: the camera becomes a draw offset, and sprites
+    are drawn through DrawnSprites.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.cells = defaultdict(set)  # (cell x, cell y): sprites
+        self.filed = {}  # sprite: (rect it was filed with, cells)
+        self.unfiled = set()
+        self.mobile = set()
+        self.order = {}  # sprite: when it was added, to keep draw order stable
+        self.counter = count()
+        self.culling = False
+        self.view = None
+        self.draw_layers = None  # layers being drawn, or None for all of them
+        self.previous = {}  # sprite: rect topleft before the last update
+        self.camera = None  # camera topleft before and after the last update
+        self.draw_rects = {}  # sprite: rect it is drawn at, while drawing
+        self.physics_batch = None  # PhysicsBatch, if physics is batched
+        super().__init__(*args, **kwargs)
+
+    def update(self, dt):
+        camera = self.cam_rect.topleft
+        self.previous = {sprite: sprite.rect.topleft for sprite in self.mobile}
+        super().update(dt)
+        if self.physics_batch is not None:
+            self.physics_batch.run(dt)
+        self.camera = camera, self.cam_rect.topleft
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.order[sprite] = next(self.counter)
+        self.unfiled.add(sprite)
+        if type(sprite) is not entity.Entity:
+            self.mobile.add(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.unfile(sprite)
+        self.unfiled.discard(sprite)
+        self.mobile.discard(sprite)
+        self.order.pop(sprite, None)
+        if self.physics_batch is not None:
+            self.physics_batch.remove(sprite)
+
+    @staticmethod
+    def get_cells(rect):
+        left, top = rect.left // CULL_CELL_SIZE, rect.top // CULL_CELL_SIZE
+        right = (rect.right - 1) // CULL_CELL_SIZE
+        bottom = (rect.bottom - 1) // CULL_CELL_SIZE
+        return [(x, y) for y in range(top, bottom + 1) for x in range(left, right + 1)]
+
+    def file(self, sprite):
+        rect = tuple(sprite.rect)
+        if sprite in self.filed and self.filed[sprite][0] == rect:
+            return
+        self.unfile(sprite)
+        cells = self.get_cells(sprite.rect)
+        for cell in cells:
+            self.cells[cell].add(sprite)
+        self.filed[sprite] = (rect, cells)
+
+    def unfile(self, sprite):
+        if sprite in self.filed:
+            for cell in self.filed.pop(sprite)[1]:
+                self.cells[cell].discard(sprite)
+
+    def sprites_in(self, rect, layers=None):
+        """Return the sprites filed in the cells that rect touches, in draw order
+
+        If layers is given, only sprites on those layers are returned.
+        """
+        for sprite in self.unfiled:
+            self.file(sprite)
+        self.unfiled.clear()
+        for sprite in self.mobile:
+            self.file(sprite)
+        found = set()
+        for cell in self.get_cells(rect):
+            found.update(self.cells.get(cell, ()))
+        if layers is not None:
+            found = {
+                sprite for sprite in found if self.get_layer_of_sprite(sprite) in layers
+            }
+        return sorted(
+            found,
+            key=lambda sprite: (self.get_layer_of_sprite(sprite), self.order[sprite]),
+        )
+
+    @staticmethod
+    def lerp(previous, current, amount):
+        """Return the point amount of the way between two, or None if too far apart"""
+        position = pygame.Vector2(previous).lerp(current, amount)
+        if position.distance_to(current) > INTERPOLATE_LIMIT:
+            return None
+        return round(position.x), round(position.y)
+
+    def get_draw_camera(self):
+        """Return the topleft the camera is drawn from"""
+        camera = pygame.Vector2(self.cam_rect.topleft)
+        # unless something moved the camera since the last update
+        if self.camera is not None and camera == self.camera[1]:
+            camera.update(
+                self.lerp(*self.camera, globals.engine.interpolation) or camera
+            )
+        return camera
+
+    def get_draw_rects(self, amount):
+        """Return where moving sprites are drawn, between their last two positions"""
+        draw_rects = {}
+        if amount >= 1:
+            return draw_rects
+        for sprite, previous in self.previous.items():
+            rect = sprite.rect
+            if rect.topleft == previous or sprite not in self.mobile:
+                continue
+            position = self.lerp(previous, rect.topleft, amount)
+            if position is not None:
+                draw_rects[sprite] = pygame.Rect(position, rect.size)
+        return draw_rects
+
+    def sprites(self):
+        if self.culling:
+            return [
+                DrawnSprite(sprite, self.draw_rects[sprite])
+                if sprite in self.draw_rects
+                else sprite
+                for sprite in self.sprites_in(self.view, self.draw_layers)
+            ]
+        return super().sprites()
+
+    def draw(self, surface, offset=None, layers=None):
+        """Draw the sprites near the area drawn
+
+        With no offset, draws through the (interpolated) camera.  Otherwise
+        the sprites are drawn at offset from the surface's topleft, even if
+        the offset is zero.  If layers is given, only those layers are drawn.
+        """
+        if offset is None:
+            camera = self.get_draw_camera()
+            if camera != self.cam_rect.topleft:
+                offset = -camera
+        if offset is None:
+            view = self.cam_rect
+        else:
+            offset = pygame.Vector2(offset)
+            view = pygame.Rect(-offset, surface.get_size())
+        self.view = view.inflate(CULL_MARGIN * 2, CULL_MARGIN * 2)
+        self.draw_rects = self.get_draw_rects(globals.engine.interpolation)
+        self.draw_layers = layers
+        self.culling = True
+        try:
+            if offset is None:
+                return super().draw(surface)
+            if not offset:
+                # TopDownGroup draws through its camera at a zero offset
+                return surface.blits(
+                    [(sprite.image, sprite.rect) for sprite in self.sprites()]
+                )
+            return super().draw(surface, offset)
+        finally:
+            self.culling = False
+            self.draw_rects = {}
+            self.draw_layers = None